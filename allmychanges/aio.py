@@ -0,0 +1,285 @@
+# coding: utf-8
+"""Asyncio version of allmychanges.api.
+
+Requires Python 3.6+ and aiohttp (pip install allmychanges[async]).
+Functions have the same names, arguments and errors as in
+allmychanges.api, but are coroutines. Function get_tags is
+an async generator:
+
+    async for tag in get_tags(opts):
+        ...
+
+Connections are kept in a per-opts aiohttp session, call
+close(opts) when it is not needed anymore.
+"""
+
+import asyncio
+import json
+import time
+
+from urllib.parse import urlencode
+
+import aiohttp
+
+from conditions import signal
+from . import api
+from .metrics import Request, endpoint_template, record
+from .api import (
+    HTTPApiError,
+    DownloaderAndSourceError,
+    NamespaceNameAlreadyExists,
+    SourceAlreadyExists)
+from .utils import (
+    changelog_id,
+    parse_project_params,
+    only_keys)
+
+
+# (base_url, token) -> running /user/ check,
+# to make concurrent callers share it
+_auth_checks = {}
+
+
+class _Response(object):
+    """Read response with the attributes of requests.Response,
+    which are used by HTTPApiError's users.
+    """
+    def __init__(self, response, content):
+        self.status_code = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+def _get_session(opts):
+    session = opts.get('aio_session')
+    if session is None or session.closed:
+        pool_size = opts.get('pool_size', api._DEFAULT_POOL_SIZE)
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=opts.get('connect_timeout',
+                                  api._DEFAULT_CONNECT_TIMEOUT),
+            sock_read=opts.get('read_timeout',
+                               api._DEFAULT_READ_TIMEOUT))
+        connector = aiohttp.TCPConnector(
+            limit=pool_size,
+            force_close=not opts.get('keep_alive', True))
+        session = aiohttp.ClientSession(connector=connector,
+                                        timeout=timeout)
+        opts['aio_session'] = session
+    return session
+
+
+async def close(opts):
+    """Closes connections opened for given opts."""
+    session = opts.pop('aio_session', None)
+    if session is not None:
+        await session.close()
+
+
+async def _call(method, opts, handle, data=None):
+    token = opts.get('token')
+    base_url = opts.get('base_url', api._BASE_URL)
+    debug = opts.get('debug', False)
+
+    if handle.startswith('http'):
+        url = handle
+    else:
+        url = base_url + handle
+
+    if token:
+        headers={'Authorization': 'Bearer ' + token}
+    else:
+        headers={}
+
+    session = _get_session(opts)
+    started_at = time.time()
+    async with session.request(method, url,
+                               headers=headers,
+                               data=data) as response:
+        response = _Response(response, await response.read())
+
+    if opts.get('request_hooks'):
+        record(opts, Request(method, url,
+                             endpoint_template(url, base_url),
+                             response.status_code,
+                             bytes=len(response.content),
+                             latency=time.time() - started_at))
+
+    if debug:
+        if response.status_code >= 300:
+            description = response.reason
+        else:
+            description = ''
+        print(u'{0} {1} → {2} {3}'.format(
+            method.upper(), url,
+            response.status_code, description))
+
+    if response.status_code == 401:
+        api._authenticated.pop((base_url, token), None)
+
+    if response.status_code >= 400:
+        signal(HTTPApiError(response.reason, response))
+
+    return response.json()
+
+
+def _get(*args, **kwargs):
+    return _call('get', *args, **kwargs)
+
+
+def _post(*args, **kwargs):
+    return _call('post', *args, **kwargs)
+
+
+async def _get_all(opts, handle):
+    """Async iterator over all objects returned by given handle.
+
+    Next page is requested before objects of the current
+    one are yielded, so requests overlap with consumer's work.
+    """
+    response = await _get(opts, handle)
+
+    while True:
+        next_url = response.get('next')
+        if next_url is None:
+            next_page = None
+        else:
+            next_page = asyncio.ensure_future(_get(opts, next_url))
+
+        try:
+            for item in response['results']:
+                yield item
+        except BaseException:
+            if next_page is not None:
+                next_page.cancel()
+            raise
+
+        if next_page is None:
+            break
+
+        response = await next_page
+
+
+async def _check_authentication(opts, key):
+    await _get(opts, '/user/')
+    api._authenticated[key] = time.time()
+
+
+async def require_authentication(opts):
+    """Same as allmychanges.api.require_authentication
+    and shares it's memory of checked tokens.
+    """
+    key = (opts.get('base_url', api._BASE_URL), opts.get('token'))
+
+    if api._is_authenticated(key, opts.get('auth_ttl')):
+        return
+
+    check = _auth_checks.get(key)
+    if check is None or check.done():
+        check = asyncio.ensure_future(_check_authentication(opts, key))
+        _auth_checks[key] = check
+    await check
+
+
+async def get_changelogs(opts, **params):
+    """Returns list of changelogs.
+    Params could be: namespace and name or tracked=True
+    """
+    handle = '/changelogs/'
+    url = handle + '?' + urlencode(params)
+    return await _get(opts, url)
+
+
+async def get_versions(opts, project, number=None):
+    """Returns list of project's versions.
+    All pages are fetched.
+    """
+    handle = '/versions/'
+    if isinstance(project, str):
+        project_params = parse_project_params(project)
+    else:
+        project_params = only_keys(project, 'namespace', 'name')
+
+    params = {'changelog__' + name: value
+              for name, value in project_params.items()}
+
+    if number is not None:
+        params['number'] = number
+
+    url = handle + '?' + urlencode(params)
+    return [item async for item in _get_all(opts, url)]
+
+
+async def tag_version(opts, project, tag, version_number):
+    await require_authentication(opts)
+
+    uri = project['resource_uri']
+    return await _post(opts,
+                       uri + u'tag/',
+                       data=dict(name=tag,
+                                 version=version_number))
+
+
+async def get_tags(opts, project=None):
+    """Async iterator over all tags or only
+    over tags of the given project.
+    """
+    await require_authentication(opts)
+
+    handle = '/tags/'
+    if not project:
+        async for tag in _get_all(opts, handle):
+            yield tag
+        return
+
+    id = changelog_id(project)
+    handle += '?' + urlencode(dict(changelog=id))
+    async for tag in _get_all(opts, handle):
+        # in case if server ignores the filter
+        if tag['changelog'] == id:
+            yield tag
+
+
+async def create_changelog(opts,
+                           namespace,
+                           name,
+                           source=None,
+                           downloader=None):
+    await require_authentication(opts)
+
+    if source and not downloader or \
+       downloader and not source:
+        signal(DownloaderAndSourceError('Both downloader and source are required'))
+
+    data = dict(namespace=namespace,
+                name=name)
+    if source and downloader:
+        data['source'] = source
+        data['downloader'] = 'downloader'
+
+    # conditions' handlers can't be used here, because their
+    # stack is shared by all coroutines running in the thread
+    try:
+        return await _post(opts, '/changelogs/', data=data)
+    except HTTPApiError as e:
+        data = e.response.json()
+        if 'Changelog with this Namespace and Name already exists' in data.get('__all__', [''])[0]:
+            signal(NamespaceNameAlreadyExists(namespace, name))
+        elif 'already exists' in data.get('source', [''])[0]:
+            signal(SourceAlreadyExists(source))
+        raise
+
+
+async def untrack_changelog(opts, changelog):
+    await require_authentication(opts)
+
+    return await _post(opts, changelog['resource_uri'] + 'untrack/')
+
+
+async def track_changelog(opts, changelog):
+    await require_authentication(opts)
+
+    return await _post(opts, changelog['resource_uri'] + 'track/')
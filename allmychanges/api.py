@@ -1,10 +1,28 @@
 # coding: utf-8
 
-import requests
-
-from six.moves.urllib.parse import urlencode
+import json
+import math
+import random
+import threading
+import time
+
+from email.utils import parsedate_tz, mktime_tz
+from six.moves.urllib.parse import (
+    urlencode,
+    urlparse,
+    urlunparse,
+    parse_qsl)
 from conditions import signal, handle
+from .cache import get_cache
+from .cassette import wrap_session
+from .metrics import Request, endpoint_template, record
+from .models import Changelog, Tag, Version, wrap
+from .concurrency import (
+    AdaptiveLimiter,
+    imap_ordered,
+    in_background)
 from .utils import (
+    batches,
     changelog_id,
     parse_project_params,
     only_keys)
@@ -12,6 +30,41 @@ from .utils import (
 
 _BASE_URL = 'https://allmychanges.com/v1'
 
+_DEFAULT_POOL_SIZE = 10
+_DEFAULT_CONNECT_TIMEOUT = 10
+_DEFAULT_READ_TIMEOUT = 60
+_DEFAULT_PREFETCH_PAGES = 2
+_DEFAULT_RETRIES = 3
+_DEFAULT_RETRY_BACKOFF = 0.5
+_DEFAULT_RETRY_MAX_DELAY = 60
+_DEFAULT_JOBS = 4
+
+# number of ids in one id__in query, to keep urls
+# far below limits of proxies
+_ID_CHUNK_SIZE = 200
+
+_IDEMPOTENT_METHODS = ('get', 'head', 'options', 'put', 'delete')
+# 429 means request was rejected before processing,
+# so it is retried for any method
+_THROTTLE_STATUSES = (429, 503)
+_RETRY_STATUSES = (429, 502, 503, 504)
+
+# statuses of items in tag_versions_bulk's report
+TAG_CREATED = 'created'
+TAG_EXISTS = 'exists'
+TAG_DUPLICATE = 'duplicate'
+TAG_FAILED = 'failed'
+
+_session_lock = threading.Lock()
+
+# (base_url, token) -> time of the last successful /user/ check
+_authenticated = {}
+_authenticated_lock = threading.Lock()
+
+# (base_url, changelog id) -> changelog, for get_changelogs_by_id
+_changelogs_by_id = {}
+_changelogs_by_id_lock = threading.Lock()
+
 
 def force_str(text):
     # TODO: use types from six
@@ -55,6 +108,157 @@ class AuthenticationRequired(RuntimeError):
     pass
 
 
+def _get_session(opts):
+    """Returns a requests.Session bound to given opts.
+
+    Session is created on the first call and stored in opts,
+    so all API calls made with the same opts share one pool
+    of keep-alive connections. When opts['record'] or opts['replay']
+    is set, requests go through a cassette (see allmychanges.cassette).
+
+    Options used: pool_size, keep_alive, record, replay.
+    """
+    session = opts.get('session')
+    if session is not None:
+        return session
+
+    # requests is imported here to not slow down
+    # startup of commands which don't use network
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    with _session_lock:
+        session = opts.get('session')
+        if session is None:
+            pool_size = opts.get('pool_size', _DEFAULT_POOL_SIZE)
+            adapter = HTTPAdapter(pool_connections=pool_size,
+                                  pool_maxsize=pool_size)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+
+            if not opts.get('keep_alive', True):
+                session.headers['Connection'] = 'close'
+
+            session = wrap_session(opts, session)
+            opts['session'] = session
+    return session
+
+
+def _get_timeout(opts):
+    return (opts.get('connect_timeout', _DEFAULT_CONNECT_TIMEOUT),
+            opts.get('read_timeout', _DEFAULT_READ_TIMEOUT))
+
+
+def _get_limiter(opts):
+    """Returns AdaptiveLimiter shared by all requests made with opts.
+
+    It allows up to opts['pool_size'] simultaneous requests and
+    lowers this number when the API starts throttling.
+    """
+    limiter = opts.get('limiter')
+    if limiter is not None:
+        return limiter
+
+    with _session_lock:
+        limiter = opts.get('limiter')
+        if limiter is None:
+            limiter = AdaptiveLimiter(
+                opts.get('pool_size', _DEFAULT_POOL_SIZE))
+            opts['limiter'] = limiter
+    return limiter
+
+
+def _retry_after(response):
+    """Returns number of seconds from Retry-After header or None."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+
+    if value.isdigit():
+        return int(value)
+
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0, mktime_tz(date) - time.time())
+
+
+def _backoff(opts, attempt):
+    """Exponential backoff with full jitter."""
+    delay = opts.get('retry_backoff', _DEFAULT_RETRY_BACKOFF) * 2 ** attempt
+    return random.uniform(0, delay)
+
+
+def _send(opts, method, url, headers, data):
+    """Sends request, retrying it on throttling, gateway errors
+    and connection problems. Only idempotent requests are retried
+    after errors which could happen when request was already processed.
+
+    Each call is passed to opts['request_hooks'] as a metrics.Request.
+
+    Options used: retries, retry_backoff, retry_max_delay.
+    """
+    import requests
+
+    session = _get_session(opts)
+    limiter = _get_limiter(opts)
+    retries = opts.get('retries', _DEFAULT_RETRIES)
+    max_delay = opts.get('retry_max_delay', _DEFAULT_RETRY_MAX_DELAY)
+    idempotent = method in _IDEMPOTENT_METHODS
+    attempt = 0
+    started_at = time.time()
+
+    def report(status, bytes=0):
+        if opts.get('request_hooks'):
+            record(opts, Request(
+                method, url,
+                endpoint_template(url, opts.get('base_url', _BASE_URL)),
+                status,
+                bytes=bytes,
+                latency=time.time() - started_at,
+                retries=attempt))
+
+    while True:
+        try:
+            with limiter:
+                response = session.request(method, url,
+                                           headers=headers,
+                                           data=data,
+                                           timeout=_get_timeout(opts))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if not idempotent or attempt >= retries:
+                report(None)
+                raise
+            reason = type(e).__name__
+            delay = _backoff(opts, attempt)
+        else:
+            status = response.status_code
+            if status in _THROTTLE_STATUSES:
+                limiter.throttled()
+            elif status < 400:
+                limiter.succeeded()
+
+            if status not in _RETRY_STATUSES \
+               or status != 429 and not idempotent \
+               or attempt >= retries:
+                report(status, len(response.content))
+                return response
+
+            reason = status
+            delay = _retry_after(response)
+            if delay is None:
+                delay = _backoff(opts, attempt)
+
+        delay = min(delay, max_delay)
+        if opts.get('debug', False):
+            print(u'{0} {1} → {2}, retrying in {3:.1f}s'.format(
+                method.upper(), url, reason, delay).encode('utf-8'))
+
+        time.sleep(delay)
+        attempt += 1
+
+
 def _call(method, opts, handle, data=None):
     token = opts.get('token')
     base_url = opts.get('base_url', _BASE_URL)
@@ -65,13 +269,34 @@ def _call(method, opts, handle, data=None):
     else:
         url = base_url + handle
 
-    func = getattr(requests, method)
     if token:
         headers={'Authorization': 'Bearer ' + token}
     else:
         headers={}
 
-    response = func(url, headers=headers, data=data)
+    cache = get_cache(opts)
+    cached = None
+    ttl = None
+    if cache is not None and method == 'get':
+        ttl = cache.ttl(url)
+        if ttl is not None:
+            cached = cache.get(token, url)
+
+    if cached is not None:
+        if cached.is_fresh(ttl):
+            if debug:
+                print(u'{0} {1} → cached'.format(
+                    method.upper(), url).encode('utf-8'))
+            if opts.get('request_hooks'):
+                record(opts, Request(method, url,
+                                     endpoint_template(url, base_url),
+                                     200,
+                                     bytes=len(cached.body),
+                                     cached=True))
+            return json.loads(cached.body.decode('utf-8'))
+        headers.update(cached.conditional_headers())
+
+    response = _send(opts, method, url, headers, data)
 
     if debug:
         if response.status_code >= 300:
@@ -82,9 +307,24 @@ def _call(method, opts, handle, data=None):
             method.upper(), url,
             response.status_code, description).encode('utf-8'))
 
+    if response.status_code == 401:
+        _authenticated.pop((base_url, token), None)
+
     if response.status_code >= 400:
         signal(HTTPApiError(response.reason, response))
 
+    if cached is not None and response.status_code == 304:
+        cache.touch(cached)
+        return json.loads(cached.body.decode('utf-8'))
+
+    if cache is not None:
+        if method == 'get':
+            if ttl is not None:
+                cache.put(token, url, response)
+        else:
+            # something was changed, cached lists could be stale now
+            cache.expire(token)
+
     return response.json()
 
 _get = lambda *args, **kwargs: _call('get', *args, **kwargs)
@@ -92,27 +332,114 @@ _post = lambda *args, **kwargs: _call('post', *args, **kwargs)
 _put = lambda *args, **kwargs: _call('put', *args, **kwargs)
 
 
+def _page_urls(response, next_url):
+    """Returns urls of all pages after the first one,
+    if response tells the number of objects and pages
+    are addressed by number. Otherwise returns None.
+    """
+    count = response.get('count')
+    page_size = len(response['results'])
+    if count is None or page_size == 0:
+        return None
+
+    parsed = urlparse(next_url)
+    query = parse_qsl(parsed.query, keep_blank_values=True)
+    if 'page' not in dict(query):
+        return None
+
+    num_pages = int(math.ceil(count / float(page_size)))
+
+    def page_url(page):
+        page_query = [(key, value)
+                      for key, value in query
+                      if key != 'page']
+        page_query.append(('page', page))
+        return urlunparse(parsed._replace(query=urlencode(page_query)))
+
+    return [page_url(page)
+            for page in range(2, num_pages + 1)]
+
+
 def _get_all(opts, handle, **kwargs):
     """Returns an iterator over all objects returned by
     given handle. Traverses multiply pages, making
     as many requests as requred.
+
+    Next pages are fetched in background while previous
+    ones are consumed. If API reports total count and numbers
+    pages, up to opts['prefetch_pages'] pages are fetched
+    in parallel. Objects are always yielded in order.
     """
     response = _get(opts, handle, **kwargs)
+    for item in _iter_pages(opts, response, **kwargs):
+        yield item
 
-    while True:
+
+def _iter_pages(opts, response, **kwargs):
+    """Yields objects from the given page of results
+    and from all pages after it.
+    """
+    lookahead = opts.get('prefetch_pages', _DEFAULT_PREFETCH_PAGES)
+
+    def get_page(url):
+        return _get(opts, url, **kwargs)
+
+    next_url = response.get('next')
+    page_urls = None
+    if next_url is not None and lookahead > 1:
+        page_urls = _page_urls(response, next_url)
+
+    if page_urls is not None:
+        pages = imap_ordered(get_page, page_urls,
+                             jobs=lookahead,
+                             backlog=lookahead)
         for item in response['results']:
             yield item
+        for response in pages:
+            for item in response['results']:
+                yield item
+        return
 
+    while True:
         next_url = response.get('next')
         if next_url is None:
+            next_page = None
+        else:
+            next_page = in_background(get_page, next_url)
+
+        for item in response['results']:
+            yield item
+
+        if next_page is None:
             break
 
-        response = _get(opts, next_url, **kwargs)
+        response = next_page.get()
+
+
+def _is_authenticated(key, ttl):
+    checked_at = _authenticated.get(key)
+    if checked_at is None:
+        return False
+    return ttl is None or time.time() - checked_at < ttl
 
 
 def require_authentication(opts):
-    """This call will raise HTTPApiError if user is not authenticated."""
-    _get(opts, '/user/')
+    """This call will raise HTTPApiError if user is not authenticated.
+
+    Successful check is remembered for the token until the process
+    exits or the API responds with 401. Set opts['auth_ttl']
+    to a number of seconds to recheck the token periodically.
+    """
+    key = (opts.get('base_url', _BASE_URL), opts.get('token'))
+    ttl = opts.get('auth_ttl')
+
+    if _is_authenticated(key, ttl):
+        return
+
+    with _authenticated_lock:
+        if not _is_authenticated(key, ttl):
+            _get(opts, '/user/')
+            _authenticated[key] = time.time()
 
 
 def get_changelogs(opts, **params):
@@ -123,10 +450,62 @@ def get_changelogs(opts, **params):
     params = {key: force_str(value)
               for key, value in params.items()}
     url = handle + '?' + urlencode(params)
-    return _get(opts, url)
+    response = _get(opts, url)
+    if isinstance(response, list):
+        return list(wrap(opts, Changelog, response))
+    return response
+
+
+def iter_changelogs(opts, **params):
+    """Returns iterator over changelogs, same as get_changelogs.
+
+    If API returns changelogs page by page, next pages
+    are fetched while previous ones are consumed.
+    """
+    response = get_changelogs(opts, **params)
+    if isinstance(response, list):
+        return iter(response)
+    return wrap(opts, Changelog, _iter_pages(opts, response))
+
+
+def get_changelogs_by_id(opts, ids):
+    """Returns dict changelog id -> changelog for given ids.
+
+    Ids are requested by chunks, up to opts['jobs'] chunks
+    in parallel. Found changelogs are remembered for the
+    rest of the process, so they are not requested again.
+    """
+    base_url = opts.get('base_url', _BASE_URL)
+    result = {}
+    missing = []
+
+    with _changelogs_by_id_lock:
+        for id in set(ids):
+            ch = _changelogs_by_id.get((base_url, id))
+            if ch is None:
+                missing.append(id)
+            else:
+                result[id] = ch
+
+    def fetch(chunk):
+        return list(iter_changelogs(
+            opts, id__in=','.join(map(str, chunk))))
+
+    chunks = batches(sorted(missing), _ID_CHUNK_SIZE)
+    for changelogs in imap_ordered(fetch, chunks,
+                                   jobs=opts.get('jobs', _DEFAULT_JOBS)):
+        with _changelogs_by_id_lock:
+            for ch in changelogs:
+                id = changelog_id(ch)
+                result[id] = ch
+                _changelogs_by_id[(base_url, id)] = ch
+    return result
 
 
 def get_versions(opts, project, number=None):
+    """Returns list of project's versions.
+    All pages are fetched.
+    """
     handle = '/versions/'
     if isinstance(project, basestring):
         project_params = parse_project_params(project)
@@ -140,9 +519,7 @@ def get_versions(opts, project, number=None):
         params['number'] = number
 
     url = handle + '?' + urlencode(params)
-    data = _get(opts, url)
-    results = data['results']
-    return results
+    return list(wrap(opts, Version, _get_all(opts, url)))
 
 
 def tag_version(opts, project, tag, version_number):
@@ -155,17 +532,90 @@ def tag_version(opts, project, tag, version_number):
                            version=version_number))
 
 
+def tag_key(project, tag, version_number):
+    """Key to compare tags: (changelog id, tag name, version)."""
+    return (changelog_id(project), tag, version_number)
+
+
+def get_tag_keys(opts):
+    """Returns set of tag_key tuples for all tags."""
+    return set((tag['changelog'], tag['name'], tag['version_number'])
+               for tag in get_tags(opts))
+
+
+def tag_versions_bulk(opts, items, existing=None):
+    """Tags many versions at once.
+
+    Items are (project, tag, version_number) triples. Duplicates
+    are dropped and versions which already have the tag are
+    skipped, only missing tags are created, up to opts['jobs']
+    at once. Existing tags are taken from one get_tags call,
+    or from `existing`, a set of tag_key tuples, which is
+    updated with created tags.
+
+    Returns a list of dicts with project, tag, version_number,
+    status and error for every item, in the same order. Status
+    is one of TAG_CREATED, TAG_EXISTS, TAG_DUPLICATE, TAG_FAILED,
+    the error is set for failed items.
+    """
+    if existing is None:
+        existing = get_tag_keys(opts)
+
+    report = []
+    to_create = []
+    seen = set()
+    for project, tag, version_number in items:
+        key = tag_key(project, tag, version_number)
+        result = dict(project=project,
+                      tag=tag,
+                      version_number=version_number,
+                      error=None)
+        if key in seen:
+            result['status'] = TAG_DUPLICATE
+        elif key in existing:
+            result['status'] = TAG_EXISTS
+        else:
+            to_create.append(result)
+        seen.add(key)
+        report.append(result)
+
+    def create(result):
+        try:
+            tag_version(opts, result['project'],
+                        result['tag'], result['version_number'])
+        except ApiError as e:
+            return e
+        return None
+
+    errors = imap_ordered(create, to_create,
+                          jobs=opts.get('jobs', _DEFAULT_JOBS))
+    for result, error in zip(to_create, errors):
+        if error is None:
+            result['status'] = TAG_CREATED
+            existing.add(tag_key(result['project'],
+                                 result['tag'],
+                                 result['version_number']))
+        else:
+            result['status'] = TAG_FAILED
+            result['error'] = error
+    return report
+
+
 def get_tags(opts, project=None):
-    """Returns iterator over all tags.
+    """Returns iterator over all tags or only
+    over tags of the given project.
     """
     require_authentication(opts)
 
     handle = '/tags/'
-    params = {}
-    if project:
-        params['project_id'] = changelog_id(project)
+    if not project:
+        return wrap(opts, Tag, _get_all(opts, handle))
 
-    return _get_all(opts, handle)
+    id = changelog_id(project)
+    handle += '?' + urlencode(dict(changelog=id))
+    # in case if server ignores the filter
+    return wrap(opts, Tag, (tag for tag in _get_all(opts, handle)
+                            if tag['changelog'] == id))
 
 
 def create_changelog(opts,
@@ -233,5 +683,4 @@ def search_category(opts, namespace):
     :param namespace:
     :return:
     """
-    handle = '/changelogs/'
-    return _get(opts, handle + '?' + urlencode(dict(namespace=namespace)))
+    return list(iter_changelogs(opts, namespace=namespace))
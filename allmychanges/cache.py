@@ -0,0 +1,207 @@
+# coding: utf-8
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from six.moves.urllib.parse import urlparse
+
+
+_DEFAULT_MAX_SIZE = 50 * 1024 * 1024
+
+# Seconds during which a cached response is returned without
+# asking the server. After that it is revalidated with a conditional
+# request. Keys are the last part of the endpoint's path, None
+# means that the endpoint is not cached at all.
+_DEFAULT_TTLS = {
+    'user': None,
+    'changelogs': 60,
+    'versions': 300,
+    'tags': 0,
+    'search-autocomplete': 3600,
+}
+_DEFAULT_TTL = 0
+
+_cache_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    body BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_owner ON responses (owner);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+
+def cache_dir(opts):
+    """Returns directory for allmychanges' local data.
+    It could be changed with opts['cache_dir'].
+    """
+    if opts.get('cache_dir'):
+        return opts['cache_dir']
+
+    base = os.environ.get('XDG_CACHE_HOME') or \
+           os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'allmychanges')
+
+
+def _hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def endpoint_name(url):
+    """Returns last part of the url's path, like 'changelogs'
+    for https://allmychanges.com/v1/changelogs/?tracked=True.
+    """
+    return urlparse(url).path.rstrip('/').rsplit('/', 1)[-1]
+
+
+class CachedResponse(object):
+    def __init__(self, key, body, etag, last_modified, stored_at):
+        self.key = key
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at
+
+    def is_fresh(self, ttl):
+        return time.time() - self.stored_at < ttl
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache(object):
+    """Persistent cache of GET responses stored in SQLite.
+
+    Responses are stored per token, along with their ETag
+    and Last-Modified validators. When total size of stored
+    bodies exceeds max_size, least recently used ones
+    are evicted.
+    """
+    def __init__(self, path, max_size=_DEFAULT_MAX_SIZE, ttls=None):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.max_size = max_size
+        self.ttls = dict(_DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def ttl(self, url):
+        return self.ttls.get(endpoint_name(url), _DEFAULT_TTL)
+
+    def get(self, token, url):
+        key = _hash(u'{0} {1}'.format(token or '', url))
+        with self._lock, self._db:
+            row = self._db.execute(
+                'SELECT body, etag, last_modified, stored_at '
+                'FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                'UPDATE responses SET accessed_at = ? WHERE key = ?',
+                (time.time(), key))
+
+        body, etag, last_modified, stored_at = row
+        return CachedResponse(key, bytes(body), etag,
+                              last_modified, stored_at)
+
+    def put(self, token, url, response):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        body = response.content
+        key = _hash(u'{0} {1}'.format(token or '', url))
+        now = time.time()
+
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(key, owner, body, etag, last_modified, '
+                ' stored_at, accessed_at, size) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, _hash(token or u''), sqlite3.Binary(body),
+                 etag, last_modified, now, now, len(body)))
+            self._evict()
+
+    def touch(self, entry):
+        """Marks entry as fresh and recently used,
+        after server confirmed it is not modified.
+        """
+        now = time.time()
+        entry.stored_at = now
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE responses SET stored_at = ?, accessed_at = ? '
+                'WHERE key = ?', (now, now, entry.key))
+
+    def expire(self, token):
+        """Makes all responses cached for the token stale.
+
+        They are kept, to be revalidated with conditional requests.
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE responses SET stored_at = 0 WHERE owner = ?',
+                (_hash(token or u''),))
+
+    def _evict(self):
+        total, = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()
+        if total <= self.max_size:
+            return
+
+        rows = self._db.execute(
+            'SELECT key, size FROM responses ORDER BY accessed_at')
+        to_delete = []
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            to_delete.append((key,))
+            total -= size
+
+        self._db.executemany('DELETE FROM responses WHERE key = ?',
+                             to_delete)
+
+
+def get_cache(opts):
+    """Returns ResponseCache for given opts or None if
+    caching is disabled.
+
+    Options used: cache, cache_dir, cache_size, cache_ttls.
+    """
+    if not opts.get('cache', False):
+        return None
+
+    cache = opts.get('cache_instance')
+    if cache is not None:
+        return cache
+
+    with _cache_lock:
+        cache = opts.get('cache_instance')
+        if cache is None:
+            cache = ResponseCache(
+                os.path.join(cache_dir(opts), 'responses.sqlite'),
+                max_size=opts.get('cache_size', _DEFAULT_MAX_SIZE),
+                ttls=opts.get('cache_ttls'))
+            opts['cache_instance'] = cache
+    return cache
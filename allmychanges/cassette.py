@@ -0,0 +1,152 @@
+# coding: utf-8
+"""Recording and replaying of API requests.
+
+With opts['record'] set to a filename, every request and its
+response are appended to this file (a cassette) as JSON lines.
+With opts['replay'] set to such file, requests are answered
+from it without network. Requests are matched by method, path,
+query and body, so a cassette recorded against one server could
+be replayed with any base_url. Tokens are not recorded.
+
+When the same request was recorded several times, responses
+are replayed in the recorded order, and the last one is repeated
+after that. A request missing in the cassette raises
+UnknownRequestError.
+
+Option replay_latency sets delay of every replayed response in
+seconds, or 'recorded' to reproduce the recorded latency.
+"""
+
+import json
+import threading
+import time
+
+from six.moves.urllib.parse import urlencode, urlparse, parse_qsl
+
+
+class UnknownRequestError(RuntimeError):
+    def __init__(self, method, url, path):
+        super(UnknownRequestError, self).__init__(
+            '{0} {1} is not in the cassette {2}'.format(
+                method.upper(), url, path))
+        self.method = method
+        self.url = url
+
+
+def _encode_body(data):
+    if not data:
+        return u''
+    if isinstance(data, dict):
+        data = sorted(data.items())
+    return urlencode(data)
+
+
+def _request_key(method, url, body):
+    parsed = urlparse(url)
+    query = urlencode(sorted(parse_qsl(parsed.query,
+                                       keep_blank_values=True)))
+    return u'{0} {1}?{2} {3}'.format(method.upper(), parsed.path,
+                                     query, body)
+
+
+class _Response(object):
+    """Replayed response with the attributes of requests.Response
+    which are used by the client.
+    """
+    def __init__(self, entry):
+        from requests.structures import CaseInsensitiveDict
+
+        self.status_code = entry['status']
+        self.reason = entry['reason']
+        self.headers = CaseInsensitiveDict(entry['headers'])
+        self.content = entry['content'].encode('utf-8')
+        self.url = entry['url']
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+class Recorder(object):
+    """Session wrapper, which appends every request
+    and its response to the cassette file.
+    """
+    def __init__(self, session, path):
+        self.session = session
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+
+    def request(self, method, url, headers=None, data=None, **kwargs):
+        started_at = time.time()
+        response = self.session.request(method, url,
+                                        headers=headers,
+                                        data=data,
+                                        **kwargs)
+        entry = dict(method=method,
+                     url=url,
+                     body=_encode_body(data),
+                     status=response.status_code,
+                     reason=response.reason,
+                     headers=dict(response.headers),
+                     content=response.content.decode('utf-8'),
+                     latency=time.time() - started_at)
+        line = json.dumps(entry, sort_keys=True) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+        return response
+
+    def close(self):
+        self._file.close()
+        self.session.close()
+
+
+class Player(object):
+    """Session replacement, which answers requests
+    from the cassette file.
+    """
+    def __init__(self, path, latency=None):
+        self.path = path
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._played = {}
+
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    key = _request_key(entry['method'], entry['url'],
+                                       entry['body'])
+                    self._entries.setdefault(key, []).append(entry)
+
+    def request(self, method, url, headers=None, data=None, **kwargs):
+        key = _request_key(method, url, _encode_body(data))
+        entries = self._entries.get(key)
+        if not entries:
+            raise UnknownRequestError(method, url, self.path)
+
+        with self._lock:
+            index = self._played.get(key, 0)
+            self._played[key] = index + 1
+        entry = entries[min(index, len(entries) - 1)]
+
+        if self.latency == 'recorded':
+            time.sleep(entry['latency'])
+        elif self.latency:
+            time.sleep(self.latency)
+        return _Response(entry)
+
+    def close(self):
+        pass
+
+
+def wrap_session(opts, session):
+    """Returns a Recorder or Player if opts['record'] or
+    opts['replay'] is set, otherwise the session itself.
+    """
+    if opts.get('replay'):
+        return Player(opts['replay'], opts.get('replay_latency'))
+    if opts.get('record'):
+        return Recorder(session, opts['record'])
+    return session
@@ -2,29 +2,43 @@
 from __future__ import division, absolute_import
 from __future__ import print_function, unicode_literals
 
+import json
 import sys
 import re
+import time
 
 import click
-import tablib
-import pkg_resources
 
-from collections import defaultdict
+from collections import defaultdict, Counter, OrderedDict
 from conditions import signal, handle
 from .api import (
     ApiError,
     HTTPApiError,
+    NamespaceNameAlreadyExists,
+    SourceAlreadyExists,
     get_changelogs,
+    iter_changelogs,
     create_changelog,
     track_changelog,
     get_versions,
-    get_tags,
     tag_version,
 )
+from . import __version__, api, mirror
+from . import journal as journal_module
+from . import watch as watch_module
+from .cache import cache_dir
+from .concurrency import imap_ordered, in_background
+from .formats import (
+    STREAMING_FORMATS,
+    format_rows,
+    read_rows)
+from .journal import Journal
+from .metrics import Stats
 from .utils import (
+    batches,
     changelog_id,
     changelog_name,
-    make_table,
+    iter_table,
     parse_project_params)
 
 
@@ -62,14 +76,29 @@ NotGiven = object()
 
 
 # first is default
-_IMPORT_EXPORT_FORMATS = ('csv', 'yaml', 'json', 'xls')
+_IMPORT_EXPORT_FORMATS = ('csv', 'yaml', 'json', 'jsonl', 'xls')
 
+# whole namespace is prefetched by _add_changelogs only
+# if at least this number of unknown projects from the input
+# are expected to be found in it. API returns a namespace at
+# once and doesn't tell it's size, so the number is high:
+# smaller inputs are resolved by lookups of single projects,
+# instead of downloading namespaces with thousands of them
+_PREFETCH_NAMESPACE_THRESHOLD = 50
 
-def _possible_formats_str():
+# number of projects from a namespace which are looked up
+# one by one, to estimate how many of them already exist
+_PREFETCH_SAMPLE_SIZE = 5
+
+# push processes streamed input by batches of this size
+_PUSH_BATCH_SIZE = 100
+
+
+def _possible_formats_str(formats=_IMPORT_EXPORT_FORMATS):
     return '{0} (default), {1} and {2}'.format(
-        _IMPORT_EXPORT_FORMATS[0],
-        ', '.join(_IMPORT_EXPORT_FORMATS[1:-1]),
-        _IMPORT_EXPORT_FORMATS[-1])
+        formats[0],
+        ', '.join(formats[1:-1]),
+        formats[-1])
 
 
 def _max_length(text, max_length):
@@ -78,18 +107,63 @@ def _max_length(text, max_length):
     return text
 
 
-def _validate_format(ctx, param, value):
-    if value not in _IMPORT_EXPORT_FORMATS:
-        raise click.BadParameter('Possible values are: {0}.'.format(
-            _possible_formats_str()))
-    return value
+def _format_option(formats):
+    def validate_format(ctx, param, value):
+        if value not in formats:
+            raise click.BadParameter('Possible values are: {0}.'.format(
+                _possible_formats_str(formats)))
+        return value
+
+    return click.option(
+        '--format',
+        default=formats[0],
+        callback=validate_format,
+        help='Data format. Possible values: {0}.'.format(
+            _possible_formats_str(formats)))
+
+
+format_option = _format_option(_IMPORT_EXPORT_FORMATS)
+
+
+offline_option = click.option(
+    '--offline',
+    is_flag=True,
+    help='Answer from the local mirror, made by "amch sync".')
+
+
+def _data_source(opts, offline):
+    """Returns a module with get_changelogs, get_versions
+    and get_tags functions: the API or the local mirror.
+    """
+    if offline:
+        if not mirror.mirror_exists(opts):
+            raise click.ClickException(
+                'Local mirror not found, run "amch sync" first.')
+        return mirror
+    return api
+
+
+wrap_option = click.option(
+    '--wrap/--no-wrap',
+    default=True,
+    help='Wrap long values to fit the table into the terminal (default). '
+         'Use --no-wrap when output goes to a pager.')
 
 
-format_option = click.option(
-    '--format',
-    default=_IMPORT_EXPORT_FORMATS[0],
-    callback=_validate_format,
-    help='Data format. Possible values: {0}.'.format(_possible_formats_str()))
+jobs_option = click.option(
+    '--jobs',
+    default=4,
+    type=click.IntRange(1),
+    help='Number of projects to process in parallel. Default is 4.')
+
+
+def _validate_replay_latency(ctx, param, value):
+    if value is None or value == 'recorded':
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        raise click.BadParameter('Should be a number or "recorded".')
 
 
 @click.group(invoke_without_command=True)
@@ -100,33 +174,117 @@ format_option = click.option(
               help='Show current version and exit.')
 @click.option('--token',
               help='Token to use when accessing AllMyChanges.com API.')
+@click.option('--pool-size',
+              type=click.IntRange(1),
+              help='Maximum number of keep-alive connections to the API.')
+@click.option('--connect-timeout',
+              type=float,
+              help='Seconds to wait for a connection to the API.')
+@click.option('--read-timeout',
+              type=float,
+              help='Seconds to wait for the API to respond.')
+@click.option('--keep-alive/--no-keep-alive',
+              default=True,
+              help='Reuse connections between requests (default).')
+@click.option('--retries',
+              type=click.IntRange(0),
+              help='How many times to retry throttled or failed requests. '
+                   'Default is 3.')
+@click.option('--no-cache',
+              is_flag=True,
+              help='Don\'t use cached API responses.')
+@click.option('--stats',
+              is_flag=True,
+              help='Print statistics of API requests to stderr '
+                   'when the command finishes.')
+@click.option('--record',
+              type=click.Path(dir_okay=False),
+              help='Append all API requests and responses to this file.')
+@click.option('--replay',
+              type=click.Path(exists=True, dir_okay=False),
+              help='Answer API requests from a file made with --record, '
+                   'without network.')
+@click.option('--replay-latency',
+              callback=_validate_replay_latency,
+              help='Delay of every replayed response in seconds, '
+                   'or "recorded" to use the recorded delays.')
 @click.pass_context
-def cli(ctx, version, token, base_url):
+def cli(ctx, version, token, base_url,
+        pool_size, connect_timeout, read_timeout, keep_alive,
+        retries, no_cache, stats, record, replay, replay_latency):
     if token:
         ctx.obj['token'] = token
 
     if base_url:
         ctx.obj['base_url'] = base_url
 
+    if pool_size:
+        ctx.obj['pool_size'] = pool_size
+
+    if connect_timeout:
+        ctx.obj['connect_timeout'] = connect_timeout
+
+    if read_timeout:
+        ctx.obj['read_timeout'] = read_timeout
+
+    if retries is not None:
+        ctx.obj['retries'] = retries
+
+    if record:
+        ctx.obj['record'] = record
+
+    if replay:
+        ctx.obj['replay'] = replay
+        ctx.obj['replay_latency'] = replay_latency
+
+    # compact objects instead of dicts from API functions
+    ctx.obj['models'] = True
+    ctx.obj['keep_alive'] = keep_alive
+    # recorded and replayed runs should make all requests
+    ctx.obj['cache'] = not (no_cache or record or replay)
+
+    if stats:
+        request_stats = Stats()
+        ctx.obj.setdefault('request_hooks', []).append(request_stats)
+        ctx.call_on_close(lambda: click.echo(request_stats.report(),
+                                             file=sys.stderr))
+
     if version:
-        distribution = pkg_resources.get_distribution('allmychanges')
-        if distribution is not None:
-            click.echo(u'{0.key}: {0.version}'.format(
-                distribution))
-            sys.exit(0)
+        click.echo(u'allmychanges: {0}'.format(__version__))
+        sys.exit(0)
 
 
 @cli.command()
 @click.option('--filename',
               help='Output filename. By default, data is written to the stdout.')
 @format_option
+@click.option('--fields',
+              default='namespace,name,source',
+              help='Comma separated list of fields to output. '
+                   'Default is "namespace,name,source".')
 @click.pass_context
-def pull(ctx, format, filename):
+def pull(ctx, format, filename, fields):
     """Pulls packages from the service into the file.
+
+    Data in csv and jsonl formats is written while it is
+    downloaded.
     """
-    changelogs = get_changelogs(ctx.obj, tracked=True)
+    changelogs = iter_changelogs(ctx.obj, tracked=True)
+    fields = tuple(field.strip()
+                   for field in fields.split(','))
+
+    if format in STREAMING_FORMATS:
+        lines = format_rows(format, fields, changelogs)
+        if filename:
+            with open(filename, 'wb') as f:
+                for line in lines:
+                    f.write(line.encode('utf-8'))
+        else:
+            for line in lines:
+                click.echo(line, nl=False)
+        return
 
-    fields = ('namespace', 'name', 'source')
+    import tablib
 
     def extract_fields(item):
         return [item.get(key)
@@ -143,6 +301,20 @@ def pull(ctx, format, filename):
         click.echo(data)
 
 
+def _read_input(format, f):
+    """Returns an iterable over rows of the input file.
+    Rows in streaming formats are read lazily.
+    """
+    if format in STREAMING_FORMATS:
+        return read_rows(format, f)
+
+    import tablib
+    dataset = tablib.Dataset()
+    setattr(dataset, format, f.read())
+    # filter out empty lines
+    return filter(None, dataset.dict)
+
+
 def show_warning_about_missing_version(e):
     click.echo(u'{0}/{1}'.format(e.namespace, e.name))
     click.echo(u'    Version {0} not found. '
@@ -154,45 +326,94 @@ def show_warning_about_missing_version(e):
 @click.option('--filename',
               help='Input filename. By default, data is read from the stdin.')
 @format_option
+@jobs_option
+@click.option('--resume',
+              is_flag=True,
+              help='Skip rows pushed by a previous interrupted run.')
+@click.option('--journal',
+              'journal_path',
+              help='File to record pushed rows to. By default, it is '
+                   'kept in the cache directory for every input file. '
+                   'Data from the stdin is journaled only with this '
+                   'option.')
 @click.pass_context
-def push(ctx, format, filename):
+def push(ctx, format, filename, jobs, resume, journal_path):
     """Gets data from a file and pushes it into the service.
+
+    Data in csv and jsonl formats is processed while it is read,
+    so it could be piped from a generator of any size.
+
+    Every processed batch of rows is recorded into a journal.
+    If push was interrupted, run it again with --resume to
+    skip rows which were already pushed. Journal is removed
+    when push completes.
     """
+    ctx.obj['jobs'] = jobs
+
+    if journal_path is None and filename:
+        journal_path = journal_module.default_path(
+            cache_dir(ctx.obj), 'push', filename)
+    if resume and journal_path is None:
+        raise click.UsageError(
+            'Give --journal option to resume push from the stdin.')
+
     if filename:
-        with open(filename, 'rb') as f:
-            data = f.read()
+        f = open(filename, 'rb')
     else:
-        data = sys.stdin.read()
+        f = sys.stdin
 
-    dataset = tablib.Dataset()
-    setattr(dataset, format, data)
-    parsed_data = dataset.dict
-    # filter out empty lines
-    parsed_data = filter(None, parsed_data)
+    journal = Journal(journal_path, resume=resume)
+    skipped = 0
 
     try:
-        _add_changelogs(ctx.obj, parsed_data)
-
-        with handle(VersionNotFoundError,
-                    show_warning_about_missing_version):
-            _tag_versions(ctx.obj, parsed_data)
+        parsed_data = _read_input(format, f)
+        tracked_changelogs = _get_tracked_changelogs(ctx.obj)
+        # taken by the first batch with tags
+        existing_tags = None
+        # namespaces fetched by previous batches
+        namespaces = {}
+
+        for batch in batches(parsed_data, _PUSH_BATCH_SIZE):
+            rows = journal.pending('add', batch)
+            index = _add_changelogs(ctx.obj, rows, tracked_changelogs,
+                                    namespaces)
+            journal.record('add', rows)
+
+            rows = journal.pending('tag', batch)
+            with handle(VersionNotFoundError,
+                        show_warning_about_missing_version):
+                existing_tags = _tag_versions(ctx.obj, rows,
+                                              existing_tags, index)
+            journal.record('tag', rows)
+            skipped += len(batch) - len(rows)
+
+        journal.remove()
+        if skipped:
+            click.echo('{0} rows were skipped, because they were pushed '
+                       'before.'.format(skipped))
 
     except HTTPApiError as e:
         if e.response.status_code == 401:
             click.echo('Please provide valid OAuth token in AMCH_TOKEN environment variable')
         else:
             raise
+    finally:
+        journal.close()
+        if filename:
+            f.close()
 
 
 @cli.command()
 @click.argument('package', nargs=-1)
+@jobs_option
 @click.pass_context
-def add(ctx, package):
+def add(ctx, package, jobs):
     """Adds one or more packages.
 
     Here PACKAGE is a string in <namespace>/<package>
     or <namespace>/<package>/<source> format.
     """
+    ctx.obj['jobs'] = jobs
 
     def parse_package(text):
         splitted = text.split('/', 2)
@@ -210,88 +431,217 @@ def add(ctx, package):
     _add_changelogs(ctx.obj, rows)
 
 
-def _add_changelogs(opts, data):
-
+def _get_tracked_changelogs(opts):
+    """Returns dict (namespace, name) -> changelog
+    of changelogs tracked by the user.
+    """
     tracked_changelogs = get_changelogs(opts, tracked=True)
-    tracked_changelogs = dict(
+    return dict(
         ((ch['namespace'], ch['name']), ch)
         for ch in tracked_changelogs)
 
+
+def _add_changelogs(opts, data, tracked_changelogs=None, namespaces=None):
+    """Creates and/or tracks changelogs for the rows.
+
+    Returns the index of changelogs (see _make_changelog_index),
+    which includes all changelogs from the rows. Pass the same
+    namespaces dict with the next rows, to reuse namespaces
+    fetched before.
+    """
+    if tracked_changelogs is None:
+        tracked_changelogs = _get_tracked_changelogs(opts)
+
     def is_tracked(changelog):
         return (changelog['namespace'],
                 changelog['name']) in tracked_changelogs
 
+    index = _make_changelog_index(opts, data, tracked_changelogs,
+                                  namespaces)
+
+    # every project is added by one task, using it's first row,
+    # otherwise parallel tasks would create the same project twice
+    rows = OrderedDict()
     for row in data:
-        if not row:
+        if row:
+            rows.setdefault((row['namespace'], row['name']), row)
+
+    def add_changelog(row):
+        return _add_changelog(opts, row, is_tracked, index)
+
+    results = imap_ordered(add_changelog, rows.values(),
+                           jobs=opts.get('jobs', 1))
+    for key, (changelog, messages) in zip(rows, results):
+        index[key] = tracked_changelogs[key] = changelog
+        for message in messages:
+            click.echo(message)
+
+    return index
+
+
+def _make_changelog_index(opts, data, tracked_changelogs,
+                          namespaces=None):
+    """Returns a dict (namespace, name) -> changelog,
+    where changelog is None for projects known to be absent.
+
+    Index contains tracked changelogs and changelogs from
+    namespaces frequent in the data, fetched with one request
+    per namespace. Before that, a few projects of every such
+    namespace are looked up one by one, and the namespace is
+    fetched only if enough projects are expected to be found
+    in it. This way new projects don't cause downloads of
+    whole namespaces, and most rows are resolved without
+    a separate lookup.
+
+    namespaces is a dict namespace -> {name: changelog} with
+    namespaces fetched before, it is extended with fetched ones.
+    Index contains only changelogs from data and tracked ones,
+    so memory doesn't grow with the number of processed rows.
+    """
+    index = dict(tracked_changelogs)
+    if namespaces is None:
+        namespaces = {}
+    jobs = opts.get('jobs', 1)
+
+    def from_namespaces(key):
+        return namespaces.get(key[0], {}).get(key[1])
+
+    keys = OrderedDict.fromkeys(
+        (row['namespace'], row['name']) for row in data if row)
+    unknown = OrderedDict()
+    for key in keys:
+        if key in index:
             continue
-        changelog = None
-        namespace, name = (row['namespace'], row['name'])
-        source = row.get('source')
-        # значит, логика добавления changelog такая:
-        # во входных данных всегда должны присутствовать namespace и name
-        # так как это уникальный идентификатор пакета в allmychanges.
-        # Поле source опционально, если оно есть, то производятся
-        # дополнительные проверки и выводятся дополнительные предупреждения
-        # со стороны allmychanges пакет может быть в трех состояниях:
-        # 1. отсутствует
-        #    - если source не указан, то запустить guesser и попросить выбрать URL
-        #    - добавить пакет
-        # 2. есть, но не затрекан
-        #    - если source указан и не такой как в allmychanges, показать предупреждение
-        #    - затрекать
-        # 3. есть и затрекан
-        #    - если source указан, то  проверить, что source затреканного такой же
-        #      и если нет, то вывести предупреждение
-
+        changelog = from_namespaces(key)
+        if changelog is not None:
+            index[key] = changelog
+        elif key[0] not in namespaces:
+            # projects missing in fetched namespaces are left to
+            # _add_changelog, they could be created since the fetch
+            unknown.setdefault(key[0], []).append(key)
+
+    candidates = [namespace_keys
+                  for namespace_keys in unknown.values()
+                  if len(namespace_keys) >= _PREFETCH_NAMESPACE_THRESHOLD]
+    samples = [key
+               for namespace_keys in candidates
+               for key in namespace_keys[:_PREFETCH_SAMPLE_SIZE]]
+
+    def find_changelog(key):
+        changelogs = get_changelogs(opts, namespace=key[0], name=key[1])
+        return changelogs[0] if changelogs else None
+
+    results = imap_ordered(find_changelog, samples, jobs=jobs)
+    for key, changelog in zip(samples, results):
+        index[key] = changelog
+
+    to_fetch = []
+    for namespace_keys in candidates:
+        sample = namespace_keys[:_PREFETCH_SAMPLE_SIZE]
+        found = sum(1 for key in sample if index[key] is not None)
+        rest = len(namespace_keys) - len(sample)
+        if found * rest / len(sample) >= _PREFETCH_NAMESPACE_THRESHOLD:
+            to_fetch.append(namespace_keys[0][0])
+
+    def fetch_namespace(namespace):
+        return get_changelogs(opts, namespace=namespace)
+
+    results = imap_ordered(fetch_namespace, to_fetch, jobs=jobs)
+    for namespace, changelogs in zip(to_fetch, results):
+        namespaces[namespace] = dict((ch['name'], ch)
+                                     for ch in changelogs)
+
+    for key in keys:
+        if key not in index:
+            changelog = from_namespaces(key)
+            if changelog is not None:
+                index[key] = changelog
+
+    return index
+
+
+def _add_changelog(opts, row, is_tracked, index):
+    """Creates and/or tracks a changelog described by the row.
+
+    Returns a tuple (changelog, messages), where messages is a list
+    of messages for the user. They are not echoed right here, because
+    rows could be processed in parallel and output should go in the
+    same order as rows.
+    """
+    messages = []
+
+    changelog = None
+    namespace, name = (row['namespace'], row['name'])
+    source = row.get('source')
+    # значит, логика добавления changelog такая:
+    # во входных данных всегда должны присутствовать namespace и name
+    # так как это уникальный идентификатор пакета в allmychanges.
+    # Поле source опционально, если оно есть, то производятся
+    # дополнительные проверки и выводятся дополнительные предупреждения
+    # со стороны allmychanges пакет может быть в трех состояниях:
+    # 1. отсутствует
+    #    - если source не указан, то запустить guesser и попросить выбрать URL
+    #    - добавить пакет
+    # 2. есть, но не затрекан
+    #    - если source указан и не такой как в allmychanges, показать предупреждение
+    #    - затрекать
+    # 3. есть и затрекан
+    #    - если source указан, то  проверить, что source затреканного такой же
+    #      и если нет, то вывести предупреждение
+
+    if (namespace, name) in index:
+        # None means that changelog is known to be absent
+        changelog = index[(namespace, name)]
+    else:
         # searching changelog in allmychange's database
         changelogs = get_changelogs(opts,
                                     namespace=namespace,
                                     name=name)
         if changelogs:
             changelog = changelogs[0]
-        else:
-            changelog = None
 
-        actions = []
+    actions = []
 
-        if changelog is None:
+    if changelog is None:
 
-            changelog = create_changelog(
-                opts,
-                namespace,
-                name,
-                source=source)
+        changelog = create_changelog(
+            opts,
+            namespace,
+            name,
+            source=source)
 
-            if source is None:
-                actions.append('added without source url')
-            else:
-                actions.append('created')
+        if source is None:
+            actions.append('added without source url')
+        else:
+            actions.append('created')
 
+        track_changelog(opts, changelog)
+        actions.append('tracked')
+    else:
+        if is_tracked(changelog):
+            if source and source != changelog['source']:
+                messages.append(
+                    ('Warning! You already tracking package '
+                     '{0[namespace]}/{0[name]}, '
+                     'but with url {0[source]}.'
+                 ).format(changelog))
+        else:
+            if source and source != changelog['source']:
+                messages.append(
+                    ('Warning! You there is package '
+                     '{0[namespace]}/{0[name]} in database, '
+                     'but with url {0[source]}.'
+                 ).format(changelog))
             track_changelog(opts, changelog)
             actions.append('tracked')
-        else:
-            if is_tracked(changelog):
-                if source and source != changelog['source']:
-                    click.echo(
-                        ('Warning! You already tracking package '
-                         '{0[namespace]}/{0[name]}, '
-                         'but with url {0[source]}.'
-                     ).format(changelog))
-            else:
-                if source and source != changelog['source']:
-                    click.echo(
-                        ('Warning! You there is package '
-                         '{0[namespace]}/{0[name]} in database, '
-                         'but with url {0[source]}.'
-                     ).format(changelog))
-                track_changelog(opts, changelog)
-                actions.append('tracked')
 
-        if actions:
-            click.echo('http://allmychanges.com/p/{namespace}/{name}/ was {actions}'.format(
-                namespace=namespace,
-                name=name,
-                actions=' and '.join(actions)))
+    if actions:
+        messages.append('http://allmychanges.com/p/{namespace}/{name}/ was {actions}'.format(
+            namespace=namespace,
+            name=name,
+            actions=' and '.join(actions)))
+
+    return changelog, messages
 
 
 def _tag_version(opts, namespace, name, version, tag):
@@ -324,54 +674,513 @@ def _tag_version(opts, namespace, name, version, tag):
             tag_version(opts, project, tag, version)
 
 
-def _tag_versions(opts, data):
+def _find_project_versions(opts, namespace, name, numbers, index=None):
+    """Returns a tuple (projects, found_numbers).
+
+    Here projects is a list of changelogs matching namespace and name,
+    and found_numbers is a set of given version numbers which are
+    known for the project. Versions are requested only if exactly
+    one project was found and some numbers differ from it's latest
+    version. Project is taken from the index of changelogs,
+    if it is there.
+    """
+    changelog = (index or {}).get((namespace, name))
+    if changelog is not None:
+        projects = [changelog]
+    else:
+        project_params = (('namespace', namespace),
+                          ('name', name))
+        project_params = {key: value
+                          for key, value in project_params
+                          if value is not None}
+
+        projects = get_changelogs(opts, **project_params)
+    found_numbers = set()
+
+    if len(projects) == 1:
+        # latest version is known without a request
+        found_numbers = set([projects[0].get('latest_version')]) & numbers
+        missing = numbers - found_numbers
+
+        if len(missing) == 1:
+            # filtered request returns a single short page
+            number, = missing
+            versions = get_versions(opts, projects[0], number=number)
+        elif missing:
+            versions = get_versions(opts, projects[0])
+        else:
+            versions = []
+
+        found_numbers.update(set(version['number']
+                                 for version in versions) & missing)
+
+    return projects, found_numbers
+
+
+def _tag_versions(opts, data, existing_tags=None, index=None):
+    """Tags versions listed in data.
+
+    Every project is resolved once, along with all it's
+    versions mentioned in the data, then only POST requests
+    to create missing tags are issued. Resolution and tagging
+    are done in parallel, but errors are signaled in data's order.
+
+    existing_tags is a set of api.tag_key tuples, which is taken
+    from the API when None. Returns it, updated with created tags.
+    Projects found in the index, returned by _add_changelogs,
+    are not requested again, and their existing tags are
+    skipped before versions are checked.
+    """
+    items = []
     for item in data:
         version = item['version']
         tag = item['tag']
         if version and tag:
-            _tag_version(opts,
-                         item['namespace'],
-                         item['name'],
-                         version,
-                         tag)
+            items.append((item['namespace'],
+                          item['name'],
+                          version,
+                          tag))
+
+    if not items:
+        return existing_tags
+
+    if existing_tags is None:
+        existing_tags = api.get_tag_keys(opts)
+
+    def exists(item):
+        namespace, name, version, tag = item
+        changelog = (index or {}).get((namespace, name))
+        return changelog is not None and \
+            api.tag_key(changelog, tag, version) in existing_tags
+
+    # existing tags need neither versions nor warnings
+    items = [item for item in items if not exists(item)]
+
+    numbers_by_project = OrderedDict()
+    for namespace, name, version, tag in items:
+        numbers_by_project.setdefault(
+            (namespace, name), set()).add(version)
+
+    def find_project_versions(args):
+        (namespace, name), numbers = args
+        return _find_project_versions(opts, namespace, name, numbers,
+                                      index)
+
+    jobs = opts.get('jobs', 1)
+    found = imap_ordered(find_project_versions,
+                         numbers_by_project.items(),
+                         jobs=jobs)
+    found = dict(zip(numbers_by_project, found))
+
+    def tags_to_create():
+        for namespace, name, version, tag in items:
+            projects, found_numbers = found[(namespace, name)]
+
+            if not projects:
+                signal(ProjectNotFoundError(u'{0}/{1}'.format(namespace, name)))
+            elif len(projects) > 1:
+                signal(MoreThanOneProjectFoundError(projects))
+            else:
+                if version not in found_numbers:
+                    signal(
+                        VersionNotFoundError(namespace,
+                                             name,
+                                             version))
+                yield projects[0], tag, version
+
+    report = api.tag_versions_bulk(opts, tags_to_create(), existing_tags)
+    for result in report:
+        if result['error'] is not None:
+            raise result['error']
+    return existing_tags
+
+
+
+@cli.command()
+@click.option('--filename',
+              help='File with desired state. By default, it is read from the stdin.')
+@format_option
+@click.option('--dry-run',
+              is_flag=True,
+              help='Only print the plan, don\'t change anything.')
+@click.option('--prune',
+              is_flag=True,
+              help='Untrack projects which are not in the file.')
+@jobs_option
+@click.pass_context
+def apply(ctx, format, filename, dry_run, prune, jobs):
+    """Makes tracked projects and tags match the file.
+
+    File has the same format as for push: every row is a project
+    which should be tracked, and if version and tag are given,
+    the version should have this tag. Current state is fetched
+    once, then only missing changes are made, in parallel.
+    """
+    opts = ctx.obj
+    opts['jobs'] = jobs
+
+    if filename:
+        f = open(filename, 'rb')
+    else:
+        f = sys.stdin
+
+    try:
+        rows = list(_read_input(format, f))
+        plan = _make_plan(opts, rows, prune)
 
+        for action, namespace, name, details in plan:
+            click.echo(_describe_action(action, namespace, name, details))
+
+        counts = Counter(action for action, _, _, _ in plan)
+        click.echo('Plan: {0} to create, {1} to track, {2} to untrack, '
+                   '{3} to tag.'.format(counts['create'],
+                                        counts['track'],
+                                        counts['untrack'],
+                                        counts['tag']))
+
+        if not dry_run:
+            for message in _apply_plan(opts, plan):
+                click.echo(message)
+
+    except HTTPApiError as e:
+        if e.response.status_code == 401:
+            click.echo('Please provide valid OAuth token in AMCH_TOKEN environment variable')
+        else:
+            raise
+    finally:
+        if filename:
+            f.close()
+
+
+def _describe_action(action, namespace, name, details):
+    text = u'{0:<8} {1}/{2}'.format(action, namespace, name)
+    if action == 'create' and details['source']:
+        text += u' ({0})'.format(details['source'])
+    elif action == 'tag':
+        text += u':{0} as {1}'.format(details['version'], details['tag'])
+    return text
+
+
+def _make_plan(opts, rows, prune=False):
+    """Returns a list of actions (action, namespace, name, details),
+    which make server's state match the rows.
+
+    Action is one of create (and track), track, untrack and tag.
+    Details is a dict with changelog (None for projects to be
+    created) and source, or tag and version for tags.
+    Server's state is fetched once: tracked projects, projects
+    mentioned in rows, and tags if rows have any.
+    """
+    desired = OrderedDict()
+    wanted_tags = []
+    for row in rows:
+        key = (row['namespace'], row['name'])
+        desired.setdefault(key, row)
+        if row.get('version') and row.get('tag'):
+            wanted_tags.append((key, row['tag'], row['version']))
+
+    tracked = _get_tracked_changelogs(opts)
+    index = _make_changelog_index(opts, list(desired.values()), tracked)
+
+    def find_changelog(key):
+        changelogs = get_changelogs(opts, namespace=key[0], name=key[1])
+        return changelogs[0] if changelogs else None
+
+    unknown = [key for key in desired if key not in index]
+    for key, changelog in zip(unknown,
+                              imap_ordered(find_changelog, unknown,
+                                           jobs=opts.get('jobs', 1))):
+        index[key] = changelog
+
+    plan = []
+    for key, row in desired.items():
+        changelog = index[key]
+        if changelog is None:
+            plan.append(('create', key[0], key[1],
+                         dict(changelog=None, source=row.get('source'))))
+        elif key not in tracked:
+            plan.append(('track', key[0], key[1],
+                         dict(changelog=changelog)))
+
+    if prune:
+        for key, changelog in sorted(tracked.items()):
+            if key not in desired:
+                plan.append(('untrack', key[0], key[1],
+                             dict(changelog=changelog)))
+
+    if wanted_tags:
+        existing_tags = api.get_tag_keys(opts)
+        seen = set()
+        for key, tag, version in wanted_tags:
+            changelog = index[key]
+            if changelog is not None:
+                tag_key = api.tag_key(changelog, tag, version)
+                if tag_key in existing_tags or tag_key in seen:
+                    continue
+                seen.add(tag_key)
+            elif (key, tag, version) in seen:
+                continue
+            else:
+                seen.add((key, tag, version))
+
+            plan.append(('tag', key[0], key[1],
+                         dict(changelog=changelog,
+                              tag=tag,
+                              version=version)))
+    return plan
+
+
+def _apply_plan(opts, plan):
+    """Executes the plan made by _make_plan and yields
+    a message for every action, in the plan's order.
+
+    Projects are created, tracked and untracked in parallel,
+    then tags are created, also in parallel. Failed actions
+    are reported and don't stop others.
+    """
+    created = {}
+
+    def run(item):
+        action, namespace, name, details = item
+        changelog = details['changelog']
+        try:
+            if action == 'create':
+                changelog = create_changelog(opts, namespace, name,
+                                             source=details['source'])
+                created[(namespace, name)] = changelog
+                track_changelog(opts, changelog)
+            elif action == 'track':
+                track_changelog(opts, changelog)
+            elif action == 'untrack':
+                api.untrack_changelog(opts, changelog)
+        except (ApiError, NamespaceNameAlreadyExists,
+                SourceAlreadyExists) as e:
+            return u'{0}: failed, {1}'.format(
+                _describe_action(*item), e)
+        return u'{0}: done'.format(_describe_action(*item))
+
+    changes = [item for item in plan if item[0] != 'tag']
+    for message in imap_ordered(run, changes, jobs=opts.get('jobs', 1)):
+        yield message
+
+    tags = [item for item in plan if item[0] == 'tag']
+    items = []
+    for action, namespace, name, details in tags:
+        changelog = details['changelog'] or created.get((namespace, name))
+        if changelog is None:
+            yield u'{0}: failed, project was not created'.format(
+                _describe_action(action, namespace, name, details))
+        else:
+            items.append(((action, namespace, name, details),
+                          (changelog, details['tag'], details['version'])))
+
+    # plan has only missing tags already
+    report = api.tag_versions_bulk(opts,
+                                   [triple for _, triple in items],
+                                   existing=set())
+    for (item, _), result in zip(items, report):
+        if result['status'] == api.TAG_FAILED:
+            yield u'{0}: failed, {1}'.format(_describe_action(*item),
+                                             result['error'])
+        else:
+            yield u'{0}: done'.format(_describe_action(*item))
+
+
+@cli.command('track-namespace')
+@click.argument('namespace')
+@jobs_option
+@click.pass_context
+def track_namespace(ctx, namespace, jobs):
+    """Tracks all projects from the namespace.
+
+    Only projects which are not tracked yet are requested
+    to be tracked, several at once.
+    """
+    opts = ctx.obj
+    opts['jobs'] = jobs
+
+    try:
+        tracked = set(changelog_id(ch)
+                      for ch in get_changelogs(opts, tracked=True))
+        changelogs = [ch for ch in api.search_category(opts, namespace)
+                      if changelog_id(ch) not in tracked]
+        _change_tracking(opts, 'Tracking', track_changelog, changelogs)
+
+    except ApiError as e:
+        report_api_error(e)
+
+
+@cli.command()
+@click.argument('project', nargs=-1)
+@click.option('--except-namespace',
+              multiple=True,
+              help='Untrack all projects except ones from this namespace. '
+                   'Could be given several times.')
+@jobs_option
+@click.pass_context
+def untrack(ctx, project, except_namespace, jobs):
+    """Stops tracking of given projects or of all projects
+    except ones from given namespaces.
+
+    Here PROJECT is a string in <namespace>/<package> format.
+    """
+    if not project and not except_namespace:
+        raise click.UsageError(
+            'Give projects to untrack or --except-namespace option.')
+
+    opts = ctx.obj
+    opts['jobs'] = jobs
+
+    try:
+        projects = set(tuple(name.split('/', 1)) for name in project)
+        keep_namespaces = set(except_namespace)
+
+        def should_untrack(ch):
+            if (ch['namespace'], ch['name']) in projects:
+                return True
+            return bool(keep_namespaces) \
+                and ch['namespace'] not in keep_namespaces
+
+        changelogs = [ch for ch in get_changelogs(opts, tracked=True)
+                      if should_untrack(ch)]
+        _change_tracking(opts, 'Untracking', api.untrack_changelog,
+                         changelogs)
+
+    except ApiError as e:
+        report_api_error(e)
+
+
+class _NoProgress(object):
+    """Iterable context manager, used instead of
+    click.progressbar when stderr is not a terminal.
+    """
+    def __init__(self, iterable):
+        self.iterable = iterable
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+
+def _change_tracking(opts, label, func, changelogs):
+    """Calls func(opts, changelog) for every changelog in parallel,
+    showing progress and throughput on stderr. Failures are
+    reported after all changelogs were processed.
+    """
+    started_at = time.time()
+
+    def change(ch):
+        try:
+            func(opts, ch)
+        except ApiError as e:
+            return u'{0}: {1}'.format(changelog_name(ch), e)
+
+    errors = []
+    # number of processed changelogs, in a list
+    # to be changed from the loop below
+    processed = [0]
+
+    def show_rate(item):
+        elapsed = time.time() - started_at
+        if not processed[0] or not elapsed:
+            return None
+        return u'{0:.1f}/s'.format(processed[0] / elapsed)
+
+    results = imap_ordered(change, changelogs, jobs=opts.get('jobs', 1))
+    if sys.stderr.isatty():
+        results = click.progressbar(results,
+                                    length=len(changelogs),
+                                    label=label,
+                                    item_show_func=show_rate,
+                                    file=sys.stderr)
+    else:
+        results = _NoProgress(results)
+
+    with results:
+        for error in results:
+            processed[0] += 1
+            if error is not None:
+                errors.append(error)
+
+    for error in errors:
+        click.echo(error, file=sys.stderr)
+
+    elapsed = time.time() - started_at
+    click.echo(u'{0} done: {1} projects in {2:.1f}s ({3:.1f}/s), '
+               u'{4} failed.'.format(
+                   label,
+                   len(changelogs) - len(errors),
+                   elapsed,
+                   len(changelogs) / elapsed if elapsed else 0,
+                   len(errors)))
+
+
+@cli.command()
+@jobs_option
+@click.pass_context
+def sync(ctx, jobs):
+    """Updates local mirror of tracked projects, their versions and tags.
+
+    Versions are downloaded only for projects with new releases.
+    After sync, commands search, tags and versions could be
+    used with --offline option.
+    """
+    try:
+        opts = ctx.obj
+        opts['jobs'] = jobs
+        stats = mirror.sync(opts, mirror.Mirror(mirror.mirror_path(opts)))
+        click.echo(
+            'Synced {changelogs} projects, versions updated '
+            'for {updated}, {tags} tags.'.format(**stats))
+
+    except ApiError as e:
+        report_api_error(e)
 
 
 @cli.command()
 @click.argument('query')
+@offline_option
+@wrap_option
 @click.pass_context
-def search(ctx, query):
+def search(ctx, query, offline, wrap):
     """Searches project or namespace on the service.
 
     Here query can be a string in <namespace> or <namespace>/<package>
     form.
     """
+    source = _data_source(ctx.obj, offline)
+
     if '/' in query:
         namespace, name = query.split('/', 1)
-        changelogs = get_changelogs(ctx.obj,
-                                    namespace=namespace,
-                                    name=name)
+        changelogs = source.get_changelogs(ctx.obj,
+                                           namespace=namespace,
+                                           name=name)
     else:
-        changelogs = get_changelogs(ctx.obj,
-                                    namespace=query)
+        changelogs = source.get_changelogs(ctx.obj,
+                                           namespace=query)
         if not changelogs:
-            changelogs = get_changelogs(ctx.obj,
-                                        name=query)
+            changelogs = source.get_changelogs(ctx.obj,
+                                               name=query)
 
 
-    data = []
-    for ch in changelogs:
-        data.append([
-            ch['namespace'],
-            ch['name'],
-            ch['latest_version'] or '',
-            _max_length(ch['description'], 80) or 'no description'])
+    data = ([ch['namespace'],
+             ch['name'],
+             ch['latest_version'] or '',
+             _max_length(ch['description'], 80) or 'no description']
+            for ch in changelogs)
 
-    table = make_table(
+    lines = iter_table(
         ['namespace', 'name', 'version', 'description'],
         data,
-        no_wrap=['namespace', 'name', 'version'])
-    click.echo(table)
+        no_wrap=['namespace', 'name', 'version'],
+        wrap=wrap)
+    for line in lines:
+        click.echo(line)
 
 
 @cli.command()
@@ -424,19 +1233,20 @@ def tag(ctx, project, version, tag):
 @click.option('--filter',
               'filter_regex',
               help='Show only tags matching regex.')
-def tags(ctx, filter_regex):
+@offline_option
+@wrap_option
+@jobs_option
+def tags(ctx, filter_regex, offline, wrap, jobs):
     """Outputs all tags along with tagged project versions.
     """
     try:
         opts = ctx.obj
-        tags = list(get_tags(opts))
-
-        changelog_ids = set(tag['changelog']
-                            for tag in tags)
-        changelog_ids = ','.join(map(unicode, changelog_ids))
-        changelogs = get_changelogs(opts, id__in=changelog_ids)
+        opts['jobs'] = jobs
+        source = _data_source(opts, offline)
+        tags = list(source.get_tags(opts))
 
-        changelogs = {changelog_id(ch): ch for ch in changelogs}
+        changelogs = source.get_changelogs_by_id(
+            opts, [tag['changelog'] for tag in tags])
         tagged_changelogs = defaultdict(list)
 
         if filter_regex:
@@ -464,19 +1274,21 @@ def tags(ctx, filter_regex):
 
         data = []
         for name, changelogs in items:
-            changelogs.sort()
+            changelogs.sort(key=tagged_project_name)
 
             data.append(
                 (name,
                  ', '.join(
                      map(tagged_project_name, changelogs))))
 
-        table = make_table(
+        lines = iter_table(
             ['tag', 'versions'],
             data,
             no_wrap=['tag'],
-            hrules=True)
-        click.echo(table)
+            hrules=True,
+            wrap=wrap)
+        for line in lines:
+            click.echo(line)
 
     except ApiError as e:
         raise
@@ -485,24 +1297,40 @@ def tags(ctx, filter_regex):
 
 @cli.command()
 @click.argument('project')
+@offline_option
 @click.pass_context
-def versions(ctx, project):
+def versions(ctx, project, offline):
     """Outputs all known versions of a given project.
 
     If project is tagged, then it's tags are printed too.
     """
     try:
         opts = ctx.obj
+        source = _data_source(opts, offline)
         project_params = parse_project_params(project)
-        project_obj = get_changelogs(opts, **project_params)
+        project_obj = source.get_changelogs(opts, **project_params)
 
         if not project_obj:
             click.echo('Project "{0}" not found.'.format(project))
-        else:
-            project_obj = project_obj[0]
+            return
+
+        project_obj = project_obj[0]
 
-        versions = get_versions(opts, project_obj)
-        tags = get_tags(opts, project_obj)
+        if offline:
+            if not source.has_versions(opts, project_obj):
+                raise click.ClickException(
+                    'Versions of "{0}" are not in the local mirror, '
+                    'they are synced only for tracked '
+                    'projects.'.format(project))
+            versions = source.get_versions(opts, project_obj)
+            tags = source.get_tags(opts, project_obj)
+        else:
+            # both lists could have many pages,
+            # so they are downloaded at the same time
+            tags = in_background(
+                lambda: list(source.get_tags(opts, project_obj)))
+            versions = source.get_versions(opts, project_obj)
+            tags = tags.get()
 
         tag_by_version = defaultdict(list)
 
@@ -524,6 +1352,66 @@ def versions(ctx, project):
         report_api_error(e)
 
 
+@cli.command()
+@click.option('--min-interval',
+              type=click.IntRange(1),
+              default=watch_module._DEFAULT_MIN_INTERVAL,
+              help='Seconds between polls of recently updated projects. '
+                   'Default is 300.')
+@click.option('--max-interval',
+              type=click.IntRange(1),
+              default=watch_module._DEFAULT_MAX_INTERVAL,
+              help='Seconds between polls of dormant projects. '
+                   'Default is one day.')
+@click.option('--refresh-interval',
+              type=click.IntRange(1),
+              default=watch_module._DEFAULT_REFRESH_INTERVAL,
+              help='Seconds between requests of the whole list of '
+                   'tracked projects. Default is one hour.')
+@click.option('--exec',
+              'command',
+              help='Shell command to run for every new version, event '
+                   'is passed to it\'s stdin as JSON.')
+@jobs_option
+@click.pass_context
+def watch(ctx, min_interval, max_interval, refresh_interval, command, jobs):
+    """Watches tracked projects for new versions.
+
+    Every new version is printed as a line of JSON, or passed
+    to the --exec command. Projects with recent releases are
+    polled more often than dormant ones. Stop it with Ctrl-C.
+    """
+    opts = ctx.obj
+    opts['jobs'] = jobs
+
+    def on_event(event):
+        line = json.dumps(event, sort_keys=True)
+        if command is None:
+            click.echo(line)
+            sys.stdout.flush()
+            return
+
+        import subprocess
+        process = subprocess.Popen(command, shell=True,
+                                   stdin=subprocess.PIPE)
+        process.communicate(line.encode('utf-8'))
+        if process.returncode:
+            click.echo('Command failed with code {0} for {1}/{2}'.format(
+                process.returncode, event['namespace'], event['name']),
+                file=sys.stderr)
+
+    def on_error(e):
+        click.echo(u'Error: {0}'.format(e), file=sys.stderr)
+
+    try:
+        watch_module.watch(opts, on_event, on_error,
+                           min_interval=min_interval,
+                           max_interval=max(min_interval, max_interval),
+                           refresh_interval=refresh_interval)
+    except KeyboardInterrupt:
+        pass
+
+
 def report_api_error(e):
     if e.response.status_code == 500:
         request_id = e.response.headers['x-request-id']
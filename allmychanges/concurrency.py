@@ -0,0 +1,173 @@
+# coding: utf-8
+
+import sys
+import threading
+import time
+
+from collections import deque
+from six import reraise
+from six.moves.queue import Queue
+
+
+# Used instead of plain Event.wait() because on Python 2
+# waiting without timeout can't be interrupted by Ctrl-C
+_WAIT_TIMEOUT = 0.1
+
+
+def _init_conditions():
+    # conditions keeps handlers and restarts in thread locals,
+    # but initializes them only in the thread which imported it
+    from conditions import handlers, restarts
+
+    for local in (handlers._handlers, restarts._restarts):
+        if not hasattr(local, 'stack'):
+            local.stack = deque()
+
+
+class _Task(object):
+    def __init__(self, func, item):
+        self.func = func
+        self.item = item
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+    def run(self):
+        try:
+            self.result = self.func(self.item)
+        except BaseException:
+            self.exc_info = sys.exc_info()
+        finally:
+            self.done.set()
+
+    def get(self):
+        while not self.done.wait(_WAIT_TIMEOUT):
+            pass
+        if self.exc_info is not None:
+            reraise(*self.exc_info)
+        return self.result
+
+
+def _worker(tasks):
+    _init_conditions()
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task.run()
+
+
+def _run_task(task):
+    _init_conditions()
+    task.run()
+
+
+def in_background(func, *args):
+    """Starts func(*args) in a separate thread.
+
+    Returns an object with method get() which waits
+    for the result and returns it or reraises an exception.
+    """
+    task = _Task(lambda item: func(*args), None)
+    thread = threading.Thread(target=_run_task, args=(task,))
+    thread.daemon = True
+    thread.start()
+    return task
+
+
+def imap_ordered(func, items, jobs=1, backlog=None):
+    """Applies func to every item using up to `jobs` threads
+    and yields results in the same order as items.
+
+    No more than `backlog` items (twice as many as jobs by default)
+    are processed or wait to be consumed at any moment, so items
+    could be a lazy iterator of any length. If func raises an
+    exception, it is reraised when the corresponding result
+    is reached.
+    """
+    if jobs <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    if backlog is None:
+        backlog = jobs * 2
+
+    tasks = Queue()
+    workers = [threading.Thread(target=_worker, args=(tasks,))
+               for i in range(jobs)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    pending = deque()
+    try:
+        for item in items:
+            task = _Task(func, item)
+            pending.append(task)
+            tasks.put(task)
+
+            if len(pending) >= backlog:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        # tasks which were not started yet are just skipped
+        for task in pending:
+            task.func = lambda item: None
+        for worker in workers:
+            tasks.put(None)
+        # workers shouldn't outlive the call, otherwise they
+        # could be woken up during the interpreter's shutdown
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(_WAIT_TIMEOUT)
+
+
+class AdaptiveLimiter(object):
+    """Limits number of simultaneous operations.
+
+    Limit is adjusted with AIMD: it grows by one after about
+    `limit` successful operations and halves when an operation
+    was throttled. Use the limiter as a context manager around
+    an operation and call succeeded() or throttled() after it.
+    """
+    # several operations are usually throttled at once,
+    # limit is decreased only once for them
+    decrease_interval = 1.0
+
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self._active = 0
+        self._decreased_at = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            while self._active >= int(self.limit):
+                self._cond.wait(_WAIT_TIMEOUT)
+            self._active += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+    def succeeded(self):
+        with self._cond:
+            if self.limit < self.max_limit:
+                self.limit = min(self.max_limit,
+                                 self.limit + 1.0 / self.limit)
+                self._cond.notify_all()
+
+    def throttled(self):
+        with self._cond:
+            now = time.time()
+            if now - self._decreased_at >= self.decrease_interval:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self._decreased_at = now
@@ -0,0 +1,99 @@
+# coding: utf-8
+
+import csv
+import json
+
+from six import PY2, BytesIO, StringIO, text_type
+
+
+# these formats could be read row by row
+STREAMING_FORMATS = ('csv', 'jsonl')
+
+
+def _lines(stream):
+    # on Python 2 iteration over a file reads ahead,
+    # which delays rows coming from a slow pipe
+    return iter(stream.readline, stream.read(0))
+
+
+def _read_csv(stream):
+    headers = None
+    for row in csv.reader(_lines(stream)):
+        if PY2:
+            row = [cell.decode('utf-8') for cell in row]
+
+        if headers is None:
+            headers = row
+            continue
+
+        if not any(row):
+            continue
+
+        row = row + [u''] * (len(headers) - len(row))
+        yield dict(zip(headers, row))
+
+
+def _read_jsonl(stream):
+    for line in _lines(stream):
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_rows(format, stream):
+    """Returns an iterator over dicts read from the stream.
+
+    Rows are parsed as soon as they come, so data could
+    be processed before the whole stream was read.
+    Empty lines are skipped.
+    """
+    if format == 'csv':
+        return _read_csv(stream)
+    if format == 'jsonl':
+        return _read_jsonl(stream)
+    raise ValueError('Format {0} can\'t be streamed'.format(format))
+
+
+
+def _format_csv(fields, rows):
+    buffer = BytesIO() if PY2 else StringIO()
+    writer = csv.writer(buffer)
+
+    def format_line(values):
+        if PY2:
+            values = [value.encode('utf-8')
+                      if isinstance(value, text_type) else value
+                      for value in values]
+        writer.writerow(['' if value is None else value
+                         for value in values])
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        if PY2:
+            line = line.decode('utf-8')
+        return line
+
+    yield format_line(fields)
+    for row in rows:
+        yield format_line([row.get(field) for field in fields])
+
+
+def _format_jsonl(fields, rows):
+    for row in rows:
+        yield json.dumps(dict((field, row.get(field))
+                              for field in fields),
+                         sort_keys=True) + u'\n'
+
+
+def format_rows(format, fields, rows):
+    """Returns an iterator over lines of text with given
+    fields of rows. Each line ends with a newline.
+
+    Rows are formatted one by one, so output could be
+    written while rows are still coming.
+    """
+    if format == 'csv':
+        return _format_csv(fields, rows)
+    if format == 'jsonl':
+        return _format_jsonl(fields, rows)
+    raise ValueError('Format {0} can\'t be streamed'.format(format))
@@ -0,0 +1,118 @@
+# coding: utf-8
+"""Journal of completed operations, used to resume
+interrupted bulk commands.
+
+Journal is a text file with a line "<operation> <row key>"
+for every completed operation. Lines are appended by batches,
+and every batch is flushed to disk before the next one is
+processed, so after a crash the journal lists all operations
+from completed batches. A truncated last line is ignored.
+"""
+
+import errno
+import hashlib
+import json
+import os
+
+
+def row_key(row):
+    """Returns a key of the input row which doesn't depend
+    on the row's position or order of it's fields.
+    """
+    data = json.dumps(row, sort_keys=True)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def default_path(directory, command, filename):
+    """Returns path of the command's journal for the input file.
+    It depends on the file's absolute path, so commands run
+    for different files don't share journals.
+    """
+    path = os.path.abspath(filename)
+    if not isinstance(path, bytes):
+        path = path.encode('utf-8')
+    return os.path.join(directory, '{0}-{1}.journal'.format(
+        command, hashlib.sha1(path).hexdigest()[:16]))
+
+
+class Journal(object):
+    def __init__(self, path, resume=False):
+        """Opens journal at the path. Unless resume is True,
+        operations recorded before are forgotten.
+
+        Only operations recorded by previous runs are kept
+        in memory, so it doesn't grow with the number of rows.
+        If path is None, nothing is recorded.
+        """
+        self.path = path
+        self._done = set()
+        self._file = None
+
+        if path is None:
+            return
+
+        truncated = False
+
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    truncated = not line.endswith('\n')
+                    if not truncated:
+                        self._done.add(tuple(line.split()))
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._file = open(path, 'a' if resume else 'w')
+        if truncated:
+            # next records should start from a new line
+            self._file.write('\n')
+
+    def is_done(self, operation, row):
+        """Returns True if operation was done for the row
+        by a previous run, which is resumed.
+        """
+        return (operation, row_key(row)) in self._done
+
+    def pending(self, operation, rows):
+        """Returns rows for which operation wasn't done
+        by a previous run.
+        """
+        if not self._done:
+            return list(rows)
+        return [row for row in rows
+                if not self.is_done(operation, row)]
+
+    def record(self, operation, rows):
+        """Writes to the disk at once, that operation
+        was done for all rows.
+        """
+        if self._file is None:
+            return
+        keys = [row_key(row) for row in rows]
+        if not keys:
+            return
+
+        self._file.write(''.join(
+            '{0} {1}\n'.format(operation, key)
+            for key in keys))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def remove(self):
+        """Closes and deletes the journal, when
+        all work is done and it isn't needed anymore.
+        """
+        self.close()
+        if self.path is None:
+            return
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            # it could be removed by another process already
+            if e.errno != errno.ENOENT:
+                raise
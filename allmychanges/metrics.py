@@ -0,0 +1,157 @@
+# coding: utf-8
+"""Instrumentation of API requests.
+
+Every request made through allmychanges.api is described by
+a Request object, which is passed to each callable from
+opts['request_hooks']. Hooks could be called from worker
+threads, so they should be thread safe. Stats is a hook
+which aggregates requests by endpoint:
+
+    stats = Stats()
+    opts['request_hooks'] = [stats]
+    get_tags(opts)
+    print(stats.report())
+"""
+
+import math
+import re
+import threading
+
+from collections import OrderedDict
+from six.moves.urllib.parse import urlparse
+
+
+_ID_RE = re.compile(r'/\d+(?=/|$)')
+
+
+class Request(object):
+    """Description of one API call.
+
+    status is None when request failed without a response,
+    cached is True when response was taken from the cache
+    without asking the server. latency is in seconds and
+    includes time spent on retries.
+    """
+    def __init__(self, method, url, endpoint, status,
+                 bytes=0, latency=0.0, retries=0, cached=False):
+        self.method = method
+        self.url = url
+        self.endpoint = endpoint
+        self.status = status
+        self.bytes = bytes
+        self.latency = latency
+        self.retries = retries
+        self.cached = cached
+
+    def __repr__(self):
+        return '<Request {0} {1} {2}>'.format(
+            self.method.upper(), self.endpoint, self.status)
+
+
+def endpoint_template(url, base_url):
+    """Returns url's path relative to base_url, without query
+    and with numeric ids replaced by {id}:
+
+    https://allmychanges.com/v1/changelogs/42/track/?a=b
+    → /changelogs/{id}/track/
+    """
+    path = urlparse(url).path
+    base_path = urlparse(base_url).path.rstrip('/')
+    if base_path and path.startswith(base_path + '/'):
+        path = path[len(base_path):]
+    return _ID_RE.sub('/{id}', path)
+
+
+def record(opts, request):
+    """Passes request to all hooks from opts['request_hooks']."""
+    for hook in opts.get('request_hooks') or ():
+        hook(request)
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    index = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[max(0, index)]
+
+
+class _EndpointStats(object):
+    def __init__(self):
+        self.requests = 0
+        self.cached = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.latencies = []
+
+    def add(self, request):
+        self.requests += 1
+        self.retries += request.retries
+        self.bytes += request.bytes
+        if request.cached:
+            self.cached += 1
+            return
+
+        self.latencies.append(request.latency)
+        if request.status is None or request.status >= 400:
+            self.errors += 1
+
+
+class Stats(object):
+    """Request hook, which counts requests, retries, errors
+    and bytes by endpoint and keeps latencies for percentiles.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = OrderedDict()
+
+    def __call__(self, request):
+        key = u'{0} {1}'.format(request.method.upper(), request.endpoint)
+        with self._lock:
+            stats = self.endpoints.get(key)
+            if stats is None:
+                stats = self.endpoints[key] = _EndpointStats()
+            stats.add(request)
+
+    def total(self):
+        total = _EndpointStats()
+        with self._lock:
+            for stats in self.endpoints.values():
+                for name in ('requests', 'cached', 'errors',
+                             'retries', 'bytes'):
+                    setattr(total, name,
+                            getattr(total, name) + getattr(stats, name))
+                total.latencies.extend(stats.latencies)
+        return total
+
+    def report(self):
+        """Returns a text table with a row per endpoint,
+        the most requested endpoints go first.
+        """
+        line = u'{0:<36} {1:>8} {2:>7} {3:>7} {4:>6} ' \
+               u'{5:>8} {6:>8} {7:>8} {8:>10}'
+        lines = [line.format('endpoint', 'requests', 'cached', 'retries',
+                             'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'bytes')]
+
+        def format_row(name, stats):
+            latencies = sorted(stats.latencies)
+            return line.format(
+                name, stats.requests, stats.cached, stats.retries,
+                stats.errors,
+                *[_format_ms(percentile(latencies, percent))
+                  for percent in (50, 95, 99)] + [stats.bytes])
+
+        with self._lock:
+            endpoints = sorted(self.endpoints.items(),
+                               key=lambda item: -item[1].requests)
+        for name, stats in endpoints:
+            lines.append(format_row(name, stats))
+        lines.append(format_row(u'total', self.total()))
+        return u'\n'.join(lines)
+
+
+def _format_ms(seconds):
+    if seconds is None:
+        return u'-'
+    return u'{0:.0f}'.format(seconds * 1000)
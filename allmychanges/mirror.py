@@ -0,0 +1,272 @@
+# coding: utf-8
+
+import json
+import os
+import sqlite3
+
+from six import string_types
+
+from . import api
+from .cache import cache_dir
+from .concurrency import imap_ordered
+from .models import Changelog, Tag, Version, as_dict, wrap
+from .utils import (
+    batches,
+    changelog_id,
+    parse_project_params)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS changelogs (
+    id INTEGER PRIMARY KEY,
+    namespace TEXT,
+    name TEXT,
+    tracked INTEGER NOT NULL DEFAULT 0,
+    versions_synced INTEGER NOT NULL DEFAULT 0,
+    synced_version TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changelogs_namespace_name
+    ON changelogs (namespace, name);
+
+CREATE TABLE IF NOT EXISTS versions (
+    changelog_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    number TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versions_changelog_id
+    ON versions (changelog_id, position);
+
+CREATE TABLE IF NOT EXISTS tags (
+    changelog_id INTEGER NOT NULL,
+    name TEXT,
+    version_number TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tags_changelog_id ON tags (changelog_id);
+"""
+
+
+def mirror_path(opts):
+    return os.path.join(cache_dir(opts), 'mirror.sqlite')
+
+
+def mirror_exists(opts):
+    return os.path.exists(mirror_path(opts))
+
+
+class Mirror(object):
+    """Local copy of tracked changelogs, their versions and all tags.
+
+    Changelogs, versions and tags are stored as JSON returned by API,
+    along with a few columns used for lookups.
+    """
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+
+    def _select(self, query, params=()):
+        return [json.loads(data)
+                for data, in self._db.execute(query, params)]
+
+    def changelogs(self, namespace=None, name=None,
+                   tracked=None, id__in=None):
+        conditions = []
+        params = []
+
+        if namespace is not None:
+            conditions.append('namespace = ?')
+            params.append(namespace)
+        if name is not None:
+            conditions.append('name = ?')
+            params.append(name)
+        if tracked is not None:
+            conditions.append('tracked = ?')
+            params.append(int(bool(tracked)))
+        if id__in is not None:
+            ids = [int(id) for id in id__in.split(',') if id]
+            conditions.append('id IN ({0})'.format(
+                ', '.join('?' * len(ids))))
+            params.extend(ids)
+
+        query = 'SELECT data FROM changelogs'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        return self._select(query + ' ORDER BY namespace, name', params)
+
+    def versions(self, changelog_id, number=None):
+        query = 'SELECT data FROM versions WHERE changelog_id = ?'
+        params = [changelog_id]
+        if number is not None:
+            query += ' AND number = ?'
+            params.append(number)
+        return self._select(query + ' ORDER BY position', params)
+
+    def tags(self, changelog_id=None):
+        if changelog_id is None:
+            return self._select('SELECT data FROM tags')
+        return self._select('SELECT data FROM tags WHERE changelog_id = ?',
+                            (changelog_id,))
+
+    def synced_versions(self):
+        """Returns dict changelog id -> latest_version
+        at the moment when changelog's versions were saved.
+        """
+        return dict(self._db.execute(
+            'SELECT id, synced_version FROM changelogs '
+            'WHERE versions_synced = 1'))
+
+    def save_changelogs(self, changelogs, tracked=None):
+        """Inserts or updates changelogs.
+
+        If tracked is True, then these changelogs become the only
+        tracked ones. If it is None, tracking flag is not changed.
+        """
+        with self._db:
+            if tracked:
+                self._db.execute('UPDATE changelogs SET tracked = 0')
+
+            for ch in changelogs:
+                id = changelog_id(ch)
+                data = json.dumps(as_dict(ch))
+                self._db.execute(
+                    'INSERT OR IGNORE INTO changelogs '
+                    '(id, namespace, name, data) VALUES (?, ?, ?, ?)',
+                    (id, ch['namespace'], ch['name'], data))
+                self._db.execute(
+                    'UPDATE changelogs SET namespace = ?, name = ?, data = ? '
+                    'WHERE id = ?',
+                    (ch['namespace'], ch['name'], data, id))
+                if tracked:
+                    self._db.execute(
+                        'UPDATE changelogs SET tracked = 1 WHERE id = ?',
+                        (id,))
+
+    def save_versions(self, changelog_id, versions, synced_version):
+        with self._db:
+            self._db.execute('DELETE FROM versions WHERE changelog_id = ?',
+                             (changelog_id,))
+            self._db.executemany(
+                'INSERT INTO versions (changelog_id, position, number, data) '
+                'VALUES (?, ?, ?, ?)',
+                ((changelog_id, position, version['number'], json.dumps(as_dict(version)))
+                 for position, version in enumerate(versions)))
+            self._db.execute(
+                'UPDATE changelogs SET versions_synced = 1, synced_version = ? '
+                'WHERE id = ?',
+                (synced_version, changelog_id))
+
+    def replace_tags(self, tags):
+        with self._db:
+            self._db.execute('DELETE FROM tags')
+            self._db.executemany(
+                'INSERT INTO tags (changelog_id, name, version_number, data) '
+                'VALUES (?, ?, ?, ?)',
+                ((tag['changelog'], tag['name'],
+                  tag['version_number'], json.dumps(as_dict(tag)))
+                 for tag in tags))
+
+
+def sync(opts, mirror):
+    """Updates mirror from the API.
+
+    Versions are fetched only for changelogs which latest_version
+    differs from one seen during the previous sync. Tags are
+    always fetched as a whole.
+
+    Returns dict with numbers of synced changelogs,
+    changelogs with updated versions and tags. Responses cache
+    is not used, so recent changes are never missed.
+    """
+    opts = dict(opts, cache=False)
+
+    tracked = api.get_changelogs(opts, tracked=True)
+    mirror.save_changelogs(tracked, tracked=True)
+
+    synced = mirror.synced_versions()
+    outdated = [ch for ch in tracked
+                if changelog_id(ch) not in synced
+                or synced[changelog_id(ch)] != ch['latest_version']]
+
+    def fetch_versions(ch):
+        return api.get_versions(opts, ch)
+
+    results = imap_ordered(fetch_versions, outdated,
+                           jobs=opts.get('jobs', 1))
+    for ch, versions in zip(outdated, results):
+        mirror.save_versions(changelog_id(ch),
+                             versions,
+                             ch['latest_version'])
+
+    tags = list(api.get_tags(opts))
+    known_ids = set(changelog_id(ch) for ch in mirror.changelogs())
+    missing_ids = set(tag['changelog'] for tag in tags) - known_ids
+    if missing_ids:
+        mirror.save_changelogs(
+            api.get_changelogs_by_id(opts, missing_ids).values())
+    mirror.replace_tags(tags)
+
+    return dict(changelogs=len(tracked),
+                updated=len(outdated),
+                tags=len(tags))
+
+
+# Functions below have the same signatures as ones from
+# allmychanges.api but answer from the local mirror
+
+
+def _open(opts):
+    mirror = opts.get('mirror_instance')
+    if mirror is None:
+        mirror = Mirror(mirror_path(opts))
+        opts['mirror_instance'] = mirror
+    return mirror
+
+
+def _find_changelog_id(opts, project):
+    if isinstance(project, string_types):
+        changelogs = _open(opts).changelogs(**parse_project_params(project))
+        if not changelogs:
+            return None
+        project = changelogs[0]
+    return changelog_id(project)
+
+
+def get_changelogs(opts, **params):
+    return list(wrap(opts, Changelog, _open(opts).changelogs(**params)))
+
+
+def get_changelogs_by_id(opts, ids):
+    result = {}
+    # SQLite limits number of query parameters
+    for chunk in batches(sorted(set(ids)), api._ID_CHUNK_SIZE):
+        for ch in get_changelogs(opts, id__in=','.join(map(str, chunk))):
+            result[changelog_id(ch)] = ch
+    return result
+
+
+def get_versions(opts, project, number=None):
+    versions = _open(opts).versions(_find_changelog_id(opts, project),
+                                    number=number)
+    return list(wrap(opts, Version, versions))
+
+
+def get_tags(opts, project=None):
+    if project is None:
+        tags = _open(opts).tags()
+    else:
+        tags = _open(opts).tags(_find_changelog_id(opts, project))
+    return list(wrap(opts, Tag, tags))
+
+
+def has_versions(opts, project):
+    """Returns True if project's versions are in the mirror.
+    They are synced only for tracked projects, other projects
+    are saved only because some tags refer to them.
+    """
+    return _find_changelog_id(opts, project) in _open(opts).synced_versions()
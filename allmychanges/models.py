@@ -0,0 +1,128 @@
+# coding: utf-8
+"""Compact objects for changelogs, versions and tags.
+
+API functions return them instead of dicts when opts['models']
+is true. Models keep known fields in slots, and other fields, if
+the API returns any, in a dict. They support read access of dicts:
+model['name'], model.get('source'), keys() and items(), so code
+written for dicts works with them too.
+
+Changelog also keeps it's id and name, parsed once, and
+utils.changelog_id and utils.changelog_name use them.
+"""
+
+from six import iteritems
+
+
+# values repeated in many objects, like namespaces and
+# tag names, are stored once
+_strings = {}
+
+
+def _shared(value):
+    if value is None:
+        return value
+    return _strings.setdefault(value, value)
+
+
+class _Model(object):
+    __slots__ = ('extra',)
+
+    # fields which are kept in slots
+    fields = ()
+    # fields which values are shared between objects
+    shared_fields = ()
+
+    def __init__(self, data):
+        extra = None
+        for key, value in iteritems(data):
+            if key in self.fields:
+                if key in self.shared_fields:
+                    value = _shared(value)
+                setattr(self, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        self.extra = extra
+
+        for key in self.fields:
+            if not hasattr(self, key):
+                setattr(self, key, None)
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            return getattr(self, key)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.fields or \
+            self.extra is not None and key in self.extra
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        keys = list(self.fields)
+        if self.extra is not None:
+            keys.extend(self.extra)
+        return keys
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return '<{0} {1!r}>'.format(type(self).__name__, self.to_dict())
+
+
+class Changelog(_Model):
+    __slots__ = ('namespace', 'name', 'source', 'description',
+                 'latest_version', 'resource_uri',
+                 'changelog_id', 'changelog_name')
+    fields = __slots__[:6]
+    shared_fields = ('namespace',)
+
+    def __init__(self, data):
+        super(Changelog, self).__init__(data)
+        self.changelog_id = None
+        if self.resource_uri:
+            self.changelog_id = int(
+                self.resource_uri.strip('/').rsplit('/', 1)[-1])
+        self.changelog_name = u'{0}/{1}'.format(self.namespace, self.name)
+
+
+class Version(_Model):
+    __slots__ = ('number',)
+    fields = __slots__
+
+
+class Tag(_Model):
+    __slots__ = ('name', 'changelog', 'version_number')
+    fields = __slots__
+    shared_fields = ('name',)
+
+
+def as_dict(obj):
+    """Returns a dict with data of a model,
+    or obj itself if it is not a model.
+    """
+    if isinstance(obj, _Model):
+        return obj.to_dict()
+    return obj
+
+
+def wrap(opts, model, items):
+    """Returns an iterator over items converted to the model
+    if opts['models'] is true, otherwise returns items as is.
+    """
+    if not opts.get('models'):
+        return items
+    return (model(item) for item in items)
@@ -1,8 +1,11 @@
 # coding: utf-8
 
 import os
-from prettytable import PrettyTable
-from operator import itemgetter
+import sys
+import textwrap
+
+from itertools import chain, islice
+from six import string_types, text_type
 
 
 def only_keys(d, *keys):
@@ -12,6 +15,20 @@ def only_keys(d, *keys):
         if key in keys}
 
 
+def batches(items, size):
+    """Splits iterable into lists of given size.
+    Last list could be shorter.
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 def parse_project_params(project):
     if '/' in project:
         namespace, name = project.split('/', 1)
@@ -23,38 +40,146 @@ def parse_project_params(project):
 
 
 def changelog_name(ch):
+    # models.Changelog has it precomputed
+    name = getattr(ch, 'changelog_name', None)
+    if name is not None:
+        return name
     return u'{0[namespace]}/{0[name]}'.format(ch)
 
 
 # TODO: make normal uri schemes along with ids
 def changelog_id(ch):
+    id = getattr(ch, 'changelog_id', None)
+    if id is not None:
+        return id
     return int(ch['resource_uri'].strip('/').rsplit('/', 1)[-1])
 
 
-def get_terminal_width():
-    rows, columns = os.popen('stty size', 'r').read().split()
-    return int(columns)
-
-
-def make_table(headers, data, no_wrap=[], hrules=False):
-    from prettytable import ALL, HEADER, NONE
-
-    max_width = get_terminal_width()
-    table = PrettyTable(max_table_width=max_width)
-    table.field_names = headers
-    table.align = 'l'
-
-    for row in data:
-        table.add_row(row)
-
-    if data:
-        for fieldname in no_wrap:
-            idx = headers.index(fieldname)
-            column_data = map(itemgetter(idx), data)
-            min_column_width = max(map(len, column_data))
-            table._min_width[fieldname] = min_column_width
-    opts = {}
-    if hrules:
-        opts['hrules'] = ALL
-
-    return table.get_string(**opts)
+def get_terminal_width(default=80):
+    """Returns width of the terminal attached to stdout.
+
+    Width is taken from COLUMNS environment variable or
+    asked from the terminal directly. If stdout is not
+    a terminal, default is returned.
+    """
+    columns = os.environ.get('COLUMNS', '')
+    if columns.isdigit():
+        return int(columns)
+
+    try:
+        import fcntl
+        import struct
+        import termios
+        size = fcntl.ioctl(sys.stdout.fileno(),
+                           termios.TIOCGWINSZ,
+                           b'\0' * 8)
+        rows, columns = struct.unpack('hh', size[:4])
+        if columns > 0:
+            return columns
+    except Exception:
+        pass
+    return default
+
+
+# column widths are computed by this number of first rows
+_TABLE_SAMPLE_SIZE = 100
+# wrapped columns are never made narrower than this
+# or than their header
+_MIN_COLUMN_WIDTH = 10
+
+
+def _cell_lines(value):
+    if value is None:
+        value = u''
+    elif not isinstance(value, string_types):
+        value = text_type(value)
+    return value.split('\n')
+
+
+def _fit_widths(widths, min_widths, wrappable, max_width):
+    """Narrows wrappable columns, widest first,
+    until table fits into max_width.
+    """
+    widths = list(widths)
+    # each column has a border and two spaces around
+    excess = sum(widths) + 3 * len(widths) + 1 - max_width
+
+    while excess > 0:
+        candidates = [idx for idx in wrappable
+                      if widths[idx] > min_widths[idx]]
+        if not candidates:
+            break
+        widest = max(candidates, key=lambda idx: widths[idx])
+        widths[widest] -= 1
+        excess -= 1
+    return widths
+
+
+def iter_table(headers, data, no_wrap=[], hrules=False, wrap=True):
+    """Yields lines of a text table with given headers and rows.
+
+    Columns are sized by first rows of data, so data could be
+    an iterator and lines are produced as rows come. If wrap is
+    true, columns not listed in no_wrap are wrapped to make table
+    fit the terminal. Otherwise, lines are never wrapped, which is
+    convenient for pagers like `less -S`. Values longer than their
+    column just stretch the row.
+    """
+    data = iter(data)
+    sample = list(islice(data, _TABLE_SAMPLE_SIZE))
+
+    widths = [len(header) for header in headers]
+    for row in sample:
+        for idx, value in enumerate(row):
+            widths[idx] = max([widths[idx]] +
+                              [len(line) for line in _cell_lines(value)])
+
+    if wrap:
+        wrappable = [idx for idx, header in enumerate(headers)
+                     if header not in no_wrap]
+        min_widths = [max(len(header), _MIN_COLUMN_WIDTH)
+                      for header in headers]
+        widths = _fit_widths(widths, min_widths, wrappable,
+                             get_terminal_width())
+
+    border = u'+' + u'+'.join(u'-' * (width + 2) for width in widths) + u'+'
+
+    def format_row(row):
+        columns = []
+        for idx, value in enumerate(row):
+            lines = _cell_lines(value)
+            if wrap and headers[idx] not in no_wrap:
+                lines = [wrapped
+                         for line in lines
+                         for wrapped in textwrap.wrap(line, widths[idx]) or [u'']]
+            columns.append(lines)
+
+        for line_idx in range(max(map(len, columns))):
+            cells = []
+            for idx, lines in enumerate(columns):
+                if line_idx < len(lines):
+                    cell = lines[line_idx]
+                else:
+                    cell = u''
+                cells.append(cell.ljust(widths[idx]))
+            yield u'| ' + u' | '.join(cells) + u' |'
+
+    yield border
+    for line in format_row(headers):
+        yield line
+    yield border
+
+    for idx, row in enumerate(chain(sample, data)):
+        if hrules and idx > 0:
+            yield border
+        for line in format_row(row):
+            yield line
+
+    yield border
+
+
+def make_table(headers, data, no_wrap=[], hrules=False, wrap=True):
+    return u'\n'.join(iter_table(headers, data,
+                                  no_wrap=no_wrap,
+                                  hrules=hrules,
+                                  wrap=wrap))
@@ -0,0 +1,179 @@
+# coding: utf-8
+"""Polling of tracked projects for new versions.
+
+Every project has it's own poll interval. It is reset to the
+minimum when a new version is found and doubles after every poll
+without changes, up to the maximum, so active projects are polled
+often and dormant ones rarely. The full list of tracked projects
+is requested once per refresh interval, to notice projects which
+were tracked, untracked or got new versions. Projects start at the
+maximum interval and become active only after such release, so
+polls don't grow with the number of tracked projects. With the
+response cache enabled, all these requests are conditional.
+"""
+
+import heapq
+import random
+import time
+
+from .api import get_changelogs
+from .concurrency import imap_ordered
+
+
+_DEFAULT_MIN_INTERVAL = 300
+_DEFAULT_MAX_INTERVAL = 24 * 60 * 60
+_DEFAULT_REFRESH_INTERVAL = 60 * 60
+
+
+class Schedule(object):
+    """Queue of projects ordered by the time of their next poll."""
+
+    def __init__(self, min_interval, max_interval):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._intervals = {}
+        self._next_at = {}
+        self._queue = []
+
+    def __contains__(self, key):
+        return key in self._intervals
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def _push(self, key, at):
+        # previous entry of the key stays in the queue
+        # and is skipped, because it's time doesn't match
+        self._next_at[key] = at
+        heapq.heappush(self._queue, (at, key))
+
+    def _is_valid(self, entry):
+        at, key = entry
+        return self._next_at.get(key) == at
+
+    def add(self, key, now):
+        # new projects are considered dormant, until the
+        # refresh notices a release
+        self._intervals[key] = self.max_interval
+        # first polls of projects added at once are spread
+        self._push(key, now + random.uniform(0, 1) * self.max_interval)
+
+    def remove(self, key):
+        self._intervals.pop(key, None)
+        self._next_at.pop(key, None)
+
+    def reschedule(self, key, changed, now):
+        """Schedules next poll of the project. When it has changed,
+        the minimal interval is used, otherwise interval grows.
+        """
+        if key not in self._intervals:
+            return
+
+        if changed:
+            interval = self.min_interval
+        else:
+            interval = min(self._intervals[key] * 2, self.max_interval)
+        self._intervals[key] = interval
+        self._push(key, now + interval)
+
+    def next_time(self):
+        while self._queue and not self._is_valid(self._queue[0]):
+            heapq.heappop(self._queue)
+        if self._queue:
+            return self._queue[0][0]
+        return None
+
+    def pop_due(self, now):
+        """Returns keys of projects which should be polled now."""
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            entry = heapq.heappop(self._queue)
+            if self._is_valid(entry):
+                due.append(entry[1])
+                del self._next_at[entry[1]]
+        return due
+
+
+def _event(changelog, previous_version):
+    return dict(event='new-version',
+                namespace=changelog['namespace'],
+                name=changelog['name'],
+                version=changelog['latest_version'],
+                previous_version=previous_version,
+                time=int(time.time()))
+
+
+def watch(opts, on_event, on_error,
+          min_interval=_DEFAULT_MIN_INTERVAL,
+          max_interval=_DEFAULT_MAX_INTERVAL,
+          refresh_interval=_DEFAULT_REFRESH_INTERVAL):
+    """Polls tracked projects forever and calls on_event(event)
+    for every new version. Event is a dict with keys event, namespace,
+    name, version, previous_version and time.
+
+    Errors of single polls are passed to on_error(exception) and
+    the project is polled again later. Up to opts['jobs'] projects
+    are polled in parallel.
+    """
+    latest_versions = {}
+    schedule = Schedule(min_interval, max_interval)
+    next_refresh = 0
+
+    def poll(key):
+        try:
+            return get_changelogs(opts, namespace=key[0], name=key[1])
+        except Exception as e:
+            return e
+
+    def update(key, changelog):
+        previous = latest_versions.get(key)
+        latest = changelog['latest_version']
+        latest_versions[key] = latest
+        if latest and previous != latest:
+            on_event(_event(changelog, previous))
+            return True
+        return False
+
+    while True:
+        now = time.time()
+
+        if now >= next_refresh:
+            try:
+                tracked = get_changelogs(opts, tracked=True)
+            except Exception as e:
+                on_error(e)
+            else:
+                keys = set()
+                for ch in tracked:
+                    key = (ch['namespace'], ch['name'])
+                    keys.add(key)
+                    if key not in schedule:
+                        # current version of a newly tracked
+                        # project is not reported
+                        schedule.add(key, now)
+                        latest_versions[key] = ch['latest_version']
+                    elif update(key, ch):
+                        schedule.reschedule(key, True, now)
+
+                for key in set(latest_versions) - keys:
+                    schedule.remove(key)
+                    del latest_versions[key]
+            next_refresh = now + refresh_interval
+
+        due = schedule.pop_due(now)
+        results = imap_ordered(poll, due, jobs=opts.get('jobs', 1))
+        for key, result in zip(due, results):
+            if isinstance(result, Exception):
+                on_error(result)
+                schedule.reschedule(key, False, now)
+            elif result:
+                schedule.reschedule(key, update(key, result[0]), now)
+            else:
+                # project disappeared, it will be forgotten by refresh
+                schedule.reschedule(key, False, now)
+
+        wake_at = next_refresh
+        next_poll = schedule.next_time()
+        if next_poll is not None:
+            wake_at = min(wake_at, next_poll)
+        time.sleep(max(0, wake_at - time.time()))
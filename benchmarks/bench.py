@@ -0,0 +1,203 @@
+# -*- encoding: utf-8 -*-
+"""Benchmarks amch commands against a local fake API server.
+
+For every dataset size, a fresh fake server is started and commands
+pull, search, tags, versions and push are run in separate processes.
+For each command wall time, number of API requests and peak memory
+of the process are reported:
+
+    python benchmarks/bench.py --sizes 100,1000 --latency 0.01
+
+Results could be saved with --output and compared between client
+versions, no network access is needed. With --compare, the run fails
+when any command became slower or makes more requests than in saved
+results:
+
+    python benchmarks/bench.py --compare baseline.json --max-slowdown 1.5
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from fake_server import Dataset, FakeServer
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# part of pushed rows which refer to projects unknown to the server
+NEW_PROJECTS_SHARE = 0.1
+
+
+def make_push_data(size):
+    """Returns CSV with `size` rows, most of them are existing projects."""
+    namespaces = Dataset.namespaces
+    lines = ['namespace,name,version,tag']
+    new_projects = int(size * NEW_PROJECTS_SHARE)
+
+    for idx in range(1, size + 1):
+        if idx <= new_projects:
+            name = 'new-package-{0}'.format(idx)
+            version = '1.0'
+        else:
+            name = 'package-{0}'.format(idx)
+            version = '{0}.1'.format(idx % 3 + 1)
+        lines.append('{0},{1},{2},benchmark'.format(
+            namespaces[idx % len(namespaces)], name, version))
+    return '\n'.join(lines) + '\n'
+
+
+def commands(data_filename):
+    project = '{0}/package-1'.format(Dataset.namespaces[1])
+    return (
+        ('pull', ['pull', '--format', 'csv']),
+        ('search', ['search', 'python']),
+        ('tags', ['tags']),
+        ('versions', ['versions', project]),
+        ('push', ['push', '--filename', data_filename]),
+    )
+
+
+def run(server, args, extra_options):
+    """Runs amch with given args in a separate process.
+
+    Returns tuple (seconds, peak memory in megabytes, exit code).
+    """
+    argv = ['amch',
+            '--base-url', server.base_url,
+            '--token', 'benchmark',
+            '--no-cache'] + extra_options + args
+    code = ('import sys; sys.argv = {0!r}; '
+            'from allmychanges.client import main; main()').format(argv)
+
+    started_at = time.time()
+    with open(os.devnull, 'wb') as devnull:
+        process = subprocess.Popen([sys.executable, '-c', code],
+                                   stdout=devnull,
+                                   stderr=devnull,
+                                   cwd=ROOT)
+        # wait4 gives resource usage of this process only
+        pid, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.time() - started_at
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on OS X
+    peak_memory = usage.ru_maxrss / 1024.0
+    if sys.platform == 'darwin':
+        peak_memory /= 1024.0
+
+    return elapsed, peak_memory, os.WEXITSTATUS(status)
+
+
+def compare(baseline, results, max_slowdown):
+    """Returns descriptions of commands which became slower
+    or make more requests than in the baseline results.
+    """
+    previous = dict(((item['size'], item['command']), item)
+                    for item in baseline)
+    regressions = []
+
+    for item in results:
+        old = previous.get((item['size'], item['command']))
+        if old is None:
+            continue
+
+        name = '{0} {1}'.format(item['command'], item['size'])
+        if item['seconds'] > old['seconds'] * max_slowdown:
+            regressions.append('{0}: {1:.2f}s instead of {2:.2f}s'.format(
+                name, item['seconds'], old['seconds']))
+        if item['requests'] > old['requests']:
+            regressions.append('{0}: {1} requests instead of {2}'.format(
+                name, item['requests'], old['requests']))
+        if item['exit_code'] != 0 and old['exit_code'] == 0:
+            regressions.append('{0}: exit code {1}'.format(
+                name, item['exit_code']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='100,1000,10000',
+                        help='Comma separated numbers of projects.')
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='Delay of every API response in seconds.')
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--commands',
+                        help='Comma separated commands to run. '
+                             'By default all are run.')
+    parser.add_argument('--amch-options', default='',
+                        help='Additional global options for amch.')
+    parser.add_argument('--output',
+                        help='Save results as JSON into this file.')
+    parser.add_argument('--compare',
+                        help='Compare with results saved by --output.')
+    parser.add_argument('--max-slowdown', type=float, default=1.5,
+                        help='Allowed ratio of time to the compared one.')
+    options = parser.parse_args()
+
+    selected = options.commands and options.commands.split(',')
+    extra_options = options.amch_options.split()
+    results = []
+
+    print('{0:>6} {1:<10} {2:>9} {3:>9} {4:>9}  {5}'.format(
+        'size', 'command', 'seconds', 'requests', 'memory', 'status'))
+
+    for size in map(int, options.sizes.split(',')):
+        # push data and it's journal are kept out of the repository
+        data_dir = tempfile.mkdtemp(prefix='amch-bench-')
+        data_filename = os.path.join(data_dir, 'push-{0}.csv'.format(size))
+        with open(data_filename, 'w') as f:
+            f.write(make_push_data(size))
+
+        server = FakeServer(Dataset(size),
+                            latency=options.latency,
+                            page_size=options.page_size).start()
+        try:
+            for name, args in commands(data_filename):
+                if selected and name not in selected:
+                    continue
+
+                server.reset_stats()
+                elapsed, memory, exit_code = run(server, args, extra_options)
+                stats = dict(server.stats)
+                requests = sum(stats.values())
+
+                status = 'ok' if exit_code == 0 else 'exit code {0}'.format(exit_code)
+                if stats.get('too-long'):
+                    status += ', {0} urls too long'.format(stats['too-long'])
+
+                print('{0:>6} {1:<10} {2:>9.2f} {3:>9} {4:>7.1f}MB  {5}'.format(
+                    size, name, elapsed, requests, memory, status))
+                results.append(dict(size=size,
+                                    command=name,
+                                    seconds=elapsed,
+                                    requests=requests,
+                                    requests_by_endpoint=stats,
+                                    memory_mb=memory,
+                                    exit_code=exit_code))
+        finally:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(data_dir)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f:
+            regressions = compare(json.load(f), results,
+                                  options.max_slowdown)
+        for regression in regressions:
+            print(regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
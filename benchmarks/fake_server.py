@@ -0,0 +1,321 @@
+# -*- encoding: utf-8 -*-
+"""Stand-in for AllMyChanges.com API, used by benchmarks.
+
+Keeps a generated dataset in memory and implements endpoints used
+by the client: /user/, /changelogs/, /versions/, /tags/,
+/search-autocomplete/, and track/, untrack/ and tag/ actions.
+Lists of versions and tags are paginated. Every response could
+be delayed to simulate network latency, and requests are counted
+by endpoint. Run it standalone with:
+
+    python benchmarks/fake_server.py --projects 1000 --latency 0.02
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import re
+import threading
+import time
+
+from collections import Counter
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse, parse_qsl, urlencode
+
+
+# most proxies reject longer urls
+MAX_URL_LENGTH = 8190
+
+_CHANGELOG_ACTION_RE = re.compile(
+    r'^/v1/changelogs/(?P<id>\d+)/(?P<action>track|untrack|tag)/$')
+
+
+class Dataset(object):
+    """Generated changelogs, their versions and tags.
+
+    Projects are spread over a few namespaces, each has
+    `versions` versions, a `tracked` fraction of them is
+    tracked and a `tagged` fraction has a tag.
+    """
+    namespaces = ('python', 'perl', 'node', 'ruby')
+
+    def __init__(self, projects=100, versions=10,
+                 tracked=0.5, tagged=0.3):
+        self.lock = threading.Lock()
+        self.changelogs = {}
+        self.by_name = {}
+        self.versions = {}
+        self.tags = []
+        self.tracked = set()
+
+        for idx in range(1, projects + 1):
+            ch = self.add_changelog(
+                self.namespaces[idx % len(self.namespaces)],
+                'package-{0}'.format(idx),
+                'https://github.com/example/package-{0}'.format(idx))
+            self.versions[idx] = [
+                '{0}.{1}'.format(idx % 3 + 1, number)
+                for number in range(versions, 0, -1)]
+            ch['latest_version'] = self.versions[idx][0]
+
+            if idx <= projects * tracked:
+                self.tracked.add(idx)
+            if idx <= projects * tagged:
+                self.tags.append(dict(name='tag-{0}'.format(idx % 50),
+                                      changelog=idx,
+                                      version_number=self.versions[idx][-1]))
+
+    def add_changelog(self, namespace, name, source=None):
+        id = len(self.changelogs) + 1
+        self.changelogs[id] = dict(
+            namespace=namespace,
+            name=name,
+            source=source or '',
+            description='Description of {0}/{1}'.format(namespace, name),
+            latest_version=None,
+            resource_uri='/v1/changelogs/{0}/'.format(id))
+        self.by_name[(namespace, name)] = id
+        self.versions[id] = []
+        return self.changelogs[id]
+
+    def find(self, namespace, name):
+        id = self.by_name.get((namespace, name))
+        if id is not None:
+            return self.changelogs[id]
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, with Nagle's algorithm
+    # every response on a kept alive connection would be delayed
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def dataset(self):
+        return self.server.dataset
+
+    def _count(self, endpoint):
+        with self.server.stats_lock:
+            self.server.stats[self.command + ' ' + endpoint] += 1
+
+    def _public(self, ch):
+        # API returns absolute urls
+        return dict(ch, resource_uri='http://{0}:{1}{2}'.format(
+            self.server.server_address[0],
+            self.server.server_address[1],
+            ch['resource_uri']))
+
+    def _send(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _page(self, items, query):
+        page_size = self.server.page_size
+        page = int(query.get('page', 1))
+        results = items[(page - 1) * page_size:page * page_size]
+
+        next_url = None
+        if page * page_size < len(items):
+            query = dict(query, page=page + 1)
+            next_url = 'http://{0}:{1}{2}?{3}'.format(
+                self.server.server_address[0],
+                self.server.server_address[1],
+                urlparse(self.path).path,
+                urlencode(sorted(query.items())))
+
+        return dict(count=len(items), next=next_url, results=results)
+
+    def _handle(self):
+        time.sleep(self.server.latency)
+
+        if len(self.path) > MAX_URL_LENGTH:
+            self._count('too-long')
+            return self._send(414, dict(detail='Request-URI Too Long'))
+
+        if self.path.startswith('/_'):
+            return self._control()
+
+        if not self.headers.get('Authorization'):
+            if self.command != 'GET' or self.path.startswith('/v1/user/'):
+                self._count('unauthorized')
+                return self._send(401, dict(detail='Authentication required'))
+
+        parsed = urlparse(self.path)
+        query = dict(parse_qsl(parsed.query))
+        path = parsed.path
+
+        with self.dataset.lock:
+            if self.command == 'GET':
+                return self._get(path, query)
+            if self.command in ('POST', 'PUT'):
+                length = int(self.headers.get('Content-Length') or 0)
+                data = dict(parse_qsl(self.rfile.read(length).decode('utf-8')))
+                return self._post(path, data)
+
+        self._send(405, dict(detail='Method not allowed'))
+
+    def _get(self, path, query):
+        dataset = self.dataset
+        self._count(path if not path.startswith('/v1/changelogs/')
+                    else '/v1/changelogs/')
+
+        if path == '/v1/user/':
+            return self._send(200, dict(username='benchmark'))
+
+        if path == '/v1/changelogs/':
+            ids = sorted(dataset.changelogs)
+            if 'namespace' in query and 'name' in query:
+                ids = [id for id in [dataset.by_name.get(
+                    (query['namespace'], query['name']))] if id]
+            if 'id__in' in query:
+                ids = sorted(set(ids) & set(
+                    int(value) for value in query['id__in'].split(',') if value))
+            if query.get('tracked') == 'True':
+                ids = [id for id in ids if id in dataset.tracked]
+
+            items = [self._public(dataset.changelogs[id])
+                     for id in ids
+                     if self._matches(dataset.changelogs[id], query)]
+            return self._send(200, items)
+
+        if path == '/v1/versions/':
+            ch = dataset.find(query.get('changelog__namespace'),
+                              query.get('changelog__name'))
+            numbers = []
+            if ch is not None:
+                numbers = dataset.versions[_id(ch)]
+            if 'number' in query:
+                numbers = [number for number in numbers
+                           if number == query['number']]
+            items = [dict(number=number) for number in numbers]
+            return self._send(200, self._page(items, query))
+
+        if path == '/v1/tags/':
+            items = dataset.tags
+            if 'changelog' in query:
+                items = [tag for tag in items
+                         if str(tag['changelog']) == query['changelog']]
+            return self._send(200, self._page(items, query))
+
+        if path == '/v1/search-autocomplete/':
+            namespace, _, name = query.get('q', '').partition('/')
+            items = [dict(source=ch['source'])
+                     for ch in dataset.changelogs.values()
+                     if ch['namespace'] == namespace and name in ch['name']]
+            return self._send(200, dict(results=items[:10]))
+
+        self._send(404, dict(detail='Not found'))
+
+    def _matches(self, ch, query):
+        for key in ('namespace', 'name'):
+            if key in query and ch[key] != query[key]:
+                return False
+        return True
+
+    def _post(self, path, data):
+        dataset = self.dataset
+
+        if path == '/v1/changelogs/':
+            self._count(path)
+            if dataset.find(data.get('namespace'), data.get('name')):
+                return self._send(400, {'__all__': [
+                    'Changelog with this Namespace and Name already exists.']})
+            ch = dataset.add_changelog(data['namespace'], data['name'],
+                                       data.get('source'))
+            return self._send(201, self._public(ch))
+
+        match = _CHANGELOG_ACTION_RE.match(path)
+        if match is None:
+            return self._send(404, dict(detail='Not found'))
+
+        action = match.group('action')
+        self._count('/v1/changelogs/*/{0}/'.format(action))
+        id = int(match.group('id'))
+        if id not in dataset.changelogs:
+            return self._send(404, dict(detail='Not found'))
+
+        if action == 'track':
+            dataset.tracked.add(id)
+        elif action == 'untrack':
+            dataset.tracked.discard(id)
+        else:
+            tag = dict(name=data['name'],
+                       changelog=id,
+                       version_number=data['version'])
+            dataset.tags = [existing for existing in dataset.tags
+                            if (existing['name'], existing['changelog']) !=
+                               (tag['name'], id)]
+            dataset.tags.append(tag)
+        return self._send(200, dict(result='ok'))
+
+    def _control(self):
+        """/_stats/ returns request counts, /_reset/ clears them."""
+        if self.path == '/_stats/':
+            with self.server.stats_lock:
+                return self._send(200, dict(self.server.stats))
+        if self.path == '/_reset/':
+            with self.server.stats_lock:
+                self.server.stats.clear()
+            return self._send(200, dict(result='ok'))
+        self._send(404, dict(detail='Not found'))
+
+    do_GET = do_POST = do_PUT = _handle
+
+
+def _id(ch):
+    return int(ch['resource_uri'].strip('/').rsplit('/', 1)[-1])
+
+
+class FakeServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, dataset, port=0, latency=0, page_size=20):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), Handler)
+        self.dataset = dataset
+        self.latency = latency
+        self.page_size = page_size
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return 'http://{0}:{1}/v1'.format(*self.server_address)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--projects', type=int, default=100)
+    parser.add_argument('--versions', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--page-size', type=int, default=20)
+    options = parser.parse_args()
+
+    server = FakeServer(Dataset(options.projects, options.versions),
+                        port=options.port,
+                        latency=options.latency,
+                        page_size=options.page_size)
+    print('Serving {0} projects at {1}'.format(options.projects,
+                                               server.base_url))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+# -*- encoding: utf-8 -*-
+"""Measures startup time of the amch command.
+
+For every subcommand, runs `amch <subcommand> --help` in a fresh
+interpreter several times and prints the median wall time along with
+heavy modules imported during startup. Use --max-ms to fail when
+any command starts slower than given number of milliseconds:
+
+    python benchmarks/startup.py --repeat 10 --max-ms 150
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+# these modules should be imported only by commands which use them
+HEAVY_MODULES = ('requests', 'tablib', 'pkg_resources')
+
+COMMANDS = (
+    ['--version'],
+    ['--help'],
+    ['add', '--help'],
+    ['apply', '--help'],
+    ['pull', '--help'],
+    ['push', '--help'],
+    ['search', '--help'],
+    ['sync', '--help'],
+    ['tag', '--help'],
+    ['tags', '--help'],
+    ['track-namespace', '--help'],
+    ['untrack', '--help'],
+    ['versions', '--help'],
+    ['watch', '--help'],
+)
+
+_RUNNER = """
+import atexit, json, sys
+def report():
+    sys.stderr.write('\\nMODULES ' + json.dumps(
+        [name for name in {heavy!r} if name in sys.modules]) + '\\n')
+atexit.register(report)
+sys.argv = ['amch'] + {args!r}
+from allmychanges.client import main
+main()
+"""
+
+
+def run(args):
+    code = _RUNNER.format(heavy=HEAVY_MODULES, args=args)
+    started_at = time.time()
+    process = subprocess.Popen([sys.executable, '-c', code],
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               cwd=os.path.dirname(os.path.dirname(
+                                   os.path.abspath(__file__))))
+    stdout, stderr = process.communicate()
+    elapsed = (time.time() - started_at) * 1000
+
+    modules = []
+    for line in stderr.decode('utf-8').splitlines():
+        if line.startswith('MODULES '):
+            modules = json.loads(line[len('MODULES '):])
+    return elapsed, modules
+
+
+def run_baseline():
+    started_at = time.time()
+    subprocess.call([sys.executable, '-c', 'pass'])
+    return (time.time() - started_at) * 1000
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-ms', type=float)
+    options = parser.parse_args()
+
+    baseline = median([run_baseline() for i in range(options.repeat)])
+    print('{0:<20} {1:>8}'.format('python itself', '%.0f ms' % baseline))
+
+    too_slow = []
+    for args in COMMANDS:
+        timings = []
+        for i in range(options.repeat):
+            elapsed, modules = run(args)
+            timings.append(elapsed)
+
+        elapsed = median(timings)
+        name = ' '.join(args)
+        print('{0:<20} {1:>8}  {2}'.format(
+            name, '%.0f ms' % elapsed, ', '.join(modules)))
+
+        if options.max_ms is not None and elapsed > options.max_ms:
+            too_slow.append(name)
+
+    if too_slow:
+        print('Slower than {0} ms: {1}'.format(
+            options.max_ms, ', '.join(too_slow)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +0,0 @@
-# -*- encoding: utf-8 -*-
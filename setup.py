@@ -1,6 +1,15 @@
+import re
+
 from setuptools import setup, find_packages
 
-setup(version='0.9.0',
+
+# version is read without importing the package,
+# because its dependencies could be not installed yet
+with open('allmychanges/__init__.py') as f:
+    version = re.search(r"__version__ = '(.+)'", f.read()).group(1)
+
+
+setup(version=version,
       name='allmychanges',
       description='A command line client to AllMyChanges.com.',
       license='BSD',
@@ -15,6 +24,8 @@ setup(version='0.9.0',
       install_requires=['click>=2.2,<3.0',
                         'conditions>=0.1.0,<0.2.0',
                         'tablib>=0.10.0,<0.11.0',
-                        'ptable>=0.9.2,<0.10.0',
-                        'requests>=2.3.0,<3.0.0',
-                        'six==1.9.0'])
+                        'requests>=2.4.0,<3.0.0',
+                        'six==1.9.0'],
+      extras_require={
+          # allmychanges.aio, Python 3.6+ only
+          'async': ['aiohttp>=3.3,<4.0']})